@@ -0,0 +1,70 @@
+/**
+ * @file dbcursor.cc
+ * @brief Definitions for DbCursor class.
+ * @author Nicu Tofan <nicu.tofan@gmail.com>
+ * @copyright Copyright 2015 piles contributors. All rights reserved.
+ * This file is released under the
+ * [MIT License](http://opensource.org/licenses/mit-license.html)
+ */
+
+#include "dbcursor.h"
+#include "dbstruct-private.h"
+#include "dbrecord.h"
+
+#include <QDebug>
+#include <QSqlError>
+#include <QSqlQuery>
+
+/**
+ * @class DbCursor
+ *
+ * The cursor runs a single forward-only `SELECT` over all the columns
+ * and retrieves each row into the same record, so reading a table of
+ * any size takes constant memory:
+ *
+ * @code
+ * Product product;
+ * DbCursor cursor (&product, &product, db);
+ * while (cursor.next ()) {
+ *     // use product
+ * }
+ * @endcode
+ *
+ * The generated table classes wrap this in a static `forEach()`.
+ */
+
+/* ------------------------------------------------------------------------- */
+DbCursor::DbCursor (DbTaew * table, DbRecord * record, QSqlDatabase & db) :
+    query_(db, table, DbStatementCache::SELECT_ALL),
+    record_(record),
+    db_(db),
+    b_valid_(false)
+{
+    DBSTRUCT_TRACE_ENTRY;
+    if (query_.isValid ()) {
+        b_valid_ = query_->exec ();
+        if (!b_valid_ && query_.renew ()) {
+            // the connection was opened again since it was prepared
+            b_valid_ = query_->exec ();
+        }
+        if (!b_valid_ && query_.isValid ()) {
+            qWarning () << "query failed: " << query_->lastQuery ();
+            qWarning () << query_->lastError ().text ();
+        }
+    }
+    DBSTRUCT_TRACE_EXIT;
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * @return false when there are no more rows
+ */
+bool DbCursor::next ()
+{
+    if (!b_valid_ || !query_->next ())
+        return false;
+    record_->clearDirty ();
+    return record_->retrieve (*query_, db_);
+}
+/* ========================================================================= */
@@ -0,0 +1,54 @@
+/**
+ * @file dbcursor.h
+ * @brief Declarations for DbCursor class
+ * @author Nicu Tofan <nicu.tofan@gmail.com>
+ * @copyright Copyright 2015 piles contributors. All rights reserved.
+ * This file is released under the
+ * [MIT License](http://opensource.org/licenses/mit-license.html)
+ */
+
+#ifndef GUARD_DBCURSOR_H_INCLUDE
+#define GUARD_DBCURSOR_H_INCLUDE
+
+#include <dbstruct/dbstruct-config.h>
+#include <dbstruct/dbstatementcache.h>
+
+class DbRecord;
+
+//! Reads the rows of a table or view one at a time into a record.
+class DBSTRUCT_EXPORT DbCursor {
+
+    DbCachedQuery query_; /**< the query over all rows */
+    DbRecord * record_; /**< receives each row */
+    QSqlDatabase & db_; /**< the connection */
+    bool b_valid_; /**< the query was executed */
+
+public:
+
+    //! Constructor; runs the query.
+    DbCursor (
+            DbTaew * table,
+            DbRecord * record,
+            QSqlDatabase & db);
+
+    //! Tell if the query was executed.
+    inline bool
+    isValid () const {
+        return b_valid_;
+    }
+
+    //! Load the next row into the record.
+    bool
+    next ();
+
+private:
+
+    //! No copies.
+    DbCursor (const DbCursor &);
+
+    //! No assignments.
+    DbCursor & operator= (const DbCursor &);
+
+}; /* class DbCursor */
+
+#endif // GUARD_DBCURSOR_H_INCLUDE
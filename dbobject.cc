@@ -101,3 +101,37 @@ QString DbObject::md5Hash (const QString &input)
                    .toHex());
 }
 /* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * The generated code uses this to look up tables, views and columns by
+ * name. A binary search over a static table takes a few comparisons and
+ * allocates nothing. Case-insensitive comparisons fold to lowercase, so
+ * the generator sorts the (ASCII) names by their lowercase form.
+ *
+ * @param value the name to look for
+ * @param names the table of names
+ * @param count the number of entries in @a names
+ * @return the index associated with the name or -1 if it is not there
+ */
+int DbObject::findName (
+        const QString & value, const DbNameIndex * names, int count)
+{
+    int first = 0;
+    int last = count - 1;
+    while (first <= last) {
+        int middle = (first + last) / 2;
+        int cmp = QString::compare (
+                    value, QLatin1String(names[middle].name),
+                    Qt::CaseInsensitive);
+        if (cmp == 0) {
+            return names[middle].index;
+        } else if (cmp < 0) {
+            last = middle - 1;
+        } else {
+            first = middle + 1;
+        }
+    }
+    return -1;
+}
+/* ========================================================================= */
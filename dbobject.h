@@ -24,6 +24,12 @@ class DbRecord;
 class DbTable;
 class DbView;
 
+//! A name and the index it stands for.
+struct DbNameIndex {
+    const char * name; /**< the name, as written in the schema */
+    int index; /**< the index of the named object */
+};
+
 //! The objecture of a database.
 class DBSTRUCT_EXPORT DbObject {
 
@@ -108,6 +114,13 @@ public:
     md5Hash (
             const QString &input);
 
+    //! Find a name, ignoring case, in a table sorted by lowercase name.
+    static int
+    findName (
+            const QString & value,
+            const DbNameIndex * names,
+            int count);
+
 };
 
 #endif // GUARD_DBOBJECT_H_INCLUDE
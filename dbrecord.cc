@@ -9,6 +9,7 @@
 
 #include "dbrecord.h"
 #include "dbstruct-private.h"
+#include "dbstatementcache.h"
 #include "dbtable.h"
 
 #include <QSqlQuery>
@@ -94,6 +95,9 @@ bool DbRecord::initFromId (DbTaew * table, QSqlDatabase & db, long db_id)
  * The value that corresponds to the column inside this instance should have
  * been initialized by the caller with the value to search for.
  *
+ * The query is prepared once for each connection, table and column
+ * (see DbStatementCache) and later calls only bind the value.
+ *
  * @param column index of the column to use for initialization
  * @return true if the instance was initialized
  */
@@ -103,40 +107,40 @@ bool DbRecord::initFrom (DbTaew * table, QSqlDatabase & db, int column)
     bool b_ret = false;
     for (;;) {
 
-        QSqlQuery query (db);
-        QString s_col_name = table->columnName (column);
-        QString statement =
-                QString("SELECT %1 FROM %2 WHERE %3=:%4;\n")
-                .arg(table->commaColumns ())
-                .arg(table->tableName())
-                .arg(s_col_name)
-                .arg(s_col_name);
-        DBREC_DEBUGM("%s\n", TMP_A(statement));
-        if (!query.prepare(statement)) {
-            qWarning () << "prepare failed: " << statement;
-            qWarning () << query.lastError ().text ();
+        DbCachedQuery query (
+                    db, table, DbStatementCache::SELECT_BY_COLUMN, column);
+        if (!query.isValid ()) {
             DBG_ASSERT(false);
             break;
         }
-        bindOne (query, column);
-        if (!query.exec()) {
-            qWarning () << "query failed: " << statement;
-            qWarning () << query.lastError ().text ();
+        bindOne (*query, column);
+        bool b_exec = query->exec ();
+        if (!b_exec && query.renew ()) {
+            // the connection was opened again since it was prepared
+            bindOne (*query, column);
+            b_exec = query->exec ();
+        }
+        if (!b_exec) {
+            if (query.isValid ()) {
+                qWarning () << "query failed: " << query->lastQuery ();
+                qWarning () << query->lastError ().text ();
+            }
             break;
         }
-        if (!query.next()) {
+        if (!query->next()) {
             DBREC_DEBUGM("Query succeed but no entry was found "
                          "in the database (%s)\n",
-                         TMP_A(query.lastError().text()));
+                         TMP_A(query->lastError().text()));
             return false;
         }
 
         // get the values to their variables
-        /*b_ret = */retrieve (query, db);
+        /*b_ret = */retrieve (*query, db);
+        clearDirty ();
         b_ret = true;
 
         int additional_result = 0;
-        while (query.next()) {
+        while (query->next()) {
             ++additional_result;
         }
         if (additional_result > 0) {
@@ -151,56 +155,112 @@ bool DbRecord::initFrom (DbTaew * table, QSqlDatabase & db, int column)
 /* ========================================================================= */
 
 /* ------------------------------------------------------------------------- */
+/**
+ * Only the real columns other than the id are written by an update.
+ *
+ * @return the columns marked as changed that an update should write,
+ * sized to the number of columns in the table
+ */
+static QBitArray updatedColumns (const QBitArray & dirty, DbTaew * table)
+{
+    QBitArray result (table->columnCount ());
+    int id_column = table->idColumn ();
+    for (int i = 0; i < dirty.size () && i < result.size (); ++i) {
+        if (dirty.testBit (i) && (i != id_column) &&
+                (table->toRealIndex (i) != -1)) {
+            result.setBit (i);
+        }
+    }
+    return result;
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * Binds the columns written by an update and the id.
+ */
+static void bindUpdated (
+        const DbRecord * record, QSqlQuery & query,
+        const QBitArray & columns, int id_column)
+{
+    for (int i = 0; i < columns.size (); ++i) {
+        if (columns.testBit (i)) {
+            record->bindOne (query, i);
+        }
+    }
+    record->bindOne (query, id_column);
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * Like initFrom(), the INSERT and UPDATE queries are prepared once for
+ * each connection and table.
+ *
+ * When some columns of an existing record were marked as changed (see
+ * setDirty()), the UPDATE only writes those; there is one prepared
+ * query for each set of columns. Otherwise all columns are written.
+ */
 bool DbRecord::save (DbTaew * table, QSqlDatabase & db)
 {
     bool b_ret = false;
     for (;;) {
 
-        QString statement;
-
-        if (isNew ()) {
-            // a new record is being added
-            statement =
-                    QString("INSERT INTO %1 (%2) VALUES (%3);")
-                    .arg(table->modifyTableName())
-                    .arg(table->commaColumnsNoId ())
-                    .arg(table->columnColumns ());
-        } else {
-            // existing record is being updated
-            statement =
-                    QString("UPDATE %1 SET %2 WHERE %3 = :%4;\n")
-                    .arg(table->modifyTableName())
-                    .arg(table->assignColumns ())
-                    .arg(table->columnName (table->idColumn ()))
-                    .arg(table->columnName (table->idColumn ()));
-        }
-        DBREC_DEBUGM("%s\n", TMP_A(statement));
-
         DBG_ASSERT(db.isOpen());
-        QSqlQuery query (db);
-
-        DBG_ASSERT(query.driver() != NULL);
-        DBG_ASSERT(query.driver()->isOpen());
-        DBG_ASSERT(!query.driver()->isOpenError());
-
-        if (!query.prepare(statement)) {
-            qWarning () << "prepare failed: " << query.lastQuery();
-            qWarning () << "query error" << query.lastError ().text ();
+        bool b_new = isNew ();
+        bool b_partial = !b_new && hasDirty ();
+        QBitArray columns;
+        if (b_partial) {
+            columns = updatedColumns (dirty_, table);
+            if (columns.count (true) == 0) {
+                // only virtual columns changed; nothing to write
+                clearDirty ();
+                b_ret = true;
+                break;
+            }
+        }
+        DbCachedQuery query (
+                    db, table, b_new ?
+                        DbStatementCache::INSERT : b_partial ?
+                            DbStatementCache::UPDATE_COLUMNS :
+                            DbStatementCache::UPDATE,
+                    -1, columns);
+        if (!query.isValid ()) {
             qWarning () << "database error" << db.lastError ().text ();
-            qWarning () << "driver error" << query.driver()->lastError ().text ();
             DBG_ASSERT(false);
             break;
         }
-        bind (query);
 
-        if (!query.exec()) {
-            qWarning () << "query failed: " << statement;
-            qWarning () << query.lastError ().text ();
+        DBG_ASSERT(query->driver() != NULL);
+        DBG_ASSERT(query->driver()->isOpen());
+        DBG_ASSERT(!query->driver()->isOpenError());
+
+        if (b_partial) {
+            bindUpdated (this, *query, columns, table->idColumn ());
+        } else {
+            bind (*query);
+        }
+        bool b_exec = query->exec ();
+        if (!b_exec && query.renew ()) {
+            // the connection was opened again since it was prepared
+            if (b_partial) {
+                bindUpdated (this, *query, columns, table->idColumn ());
+            } else {
+                bind (*query);
+            }
+            b_exec = query->exec ();
+        }
+        if (!b_exec) {
+            if (query.isValid ()) {
+                qWarning () << "query failed: " << query->lastQuery ();
+                qWarning () << query->lastError ().text ();
+            }
             break;
         }
-        if (isNew ()) {
-            setId (static_cast<long>(query.lastInsertId().toLongLong ()));
+        if (b_new) {
+            setId (static_cast<long>(query->lastInsertId().toLongLong ()));
         }
+        clearDirty ();
 
         b_ret = true;
         break;
@@ -259,3 +319,28 @@ long DbRecord::getId () const
     return DbTable::ID_UNAVAILABLE;
 }
 /* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * The generated setters call this. Members that are assigned directly
+ * are not tracked; either mark them here or use the generated
+ * `markChanged()` with a copy taken before the changes. Once a column
+ * is marked, save() only writes the marked columns.
+ */
+void DbRecord::setDirty (int column)
+{
+    if (column < 0)
+        return;
+    if (column >= dirty_.size ()) {
+        dirty_.resize (column + 1);
+    }
+    dirty_.setBit (column);
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+bool DbRecord::hasDirty () const
+{
+    return dirty_.count (true) > 0;
+}
+/* ========================================================================= */
@@ -15,6 +15,7 @@
 #include <dbstruct/dbcolumn.h>
 #include <assert.h>
 
+#include <QBitArray>
 #include <QMap>
 #include <QString>
 #include <QVariant>
@@ -33,6 +34,8 @@ typedef QMap<QString, QVariant> DbRecMap;
 //! A record in a database.
 class DBSTRUCT_EXPORT DbRecord  {
 
+    QBitArray dirty_; /**< columns changed since the record was loaded */
+
 public:
 
     //! Default constructor.
@@ -125,6 +128,34 @@ public:
     virtual long
     getId () const;
 
+    //! Mark a column as changed since the record was loaded or saved.
+    void
+    setDirty (
+            int column);
+
+    //! Tell if a column was marked as changed.
+    bool
+    isDirty (
+            int column) const {
+        return (column < dirty_.size ()) && dirty_.testBit (column);
+    }
+
+    //! Tell if any column was marked as changed.
+    bool
+    hasDirty () const;
+
+    //! Forget the columns marked as changed.
+    void
+    clearDirty () {
+        dirty_.clear ();
+    }
+
+    //! The columns marked as changed, one bit per column index.
+    const QBitArray &
+    dirtyColumns () const {
+        return dirty_;
+    }
+
 
 protected:
 
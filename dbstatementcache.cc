@@ -0,0 +1,374 @@
+/**
+ * @file dbstatementcache.cc
+ * @brief Definitions for DbStatementCache class.
+ * @author Nicu Tofan <nicu.tofan@gmail.com>
+ * @copyright Copyright 2015 piles contributors. All rights reserved.
+ * This file is released under the
+ * [MIT License](http://opensource.org/licenses/mit-license.html)
+ */
+
+#include "dbstatementcache.h"
+#include "dbstruct-private.h"
+#include "dbtaew.h"
+
+#include <QAtomicInt>
+#include <QDebug>
+#include <QHash>
+#include <QSqlDatabase>
+#include <QSqlDriver>
+#include <QSqlError>
+#include <QSqlQuery>
+#include <QThreadStorage>
+
+/**
+ * @class DbStatementCache
+ *
+ * Building the text of a statement and preparing it costs more than
+ * binding new values and executing it. The cache keeps one prepared
+ * query for each connection, table or view, kind of statement and
+ * column (or set of columns), so that only the first use pays for it.
+ *
+ * A connection may only be used from the thread that created it, so
+ * each thread has its own cache. Queries prepared for a connection are
+ * dropped when the connection is found closed, when its driver
+ * changes and when invalidate() is called. Call invalidate() (or use
+ * close()) before removing a connection with
+ * QSqlDatabase::removeDatabase().
+ */
+
+namespace {
+
+//! Identifies a statement inside a connection.
+struct StatementKey {
+    QString table;
+    int kind;
+    int column;
+    QBitArray columns;
+
+    bool operator== (const StatementKey & other) const {
+        return (kind == other.kind) &&
+                (column == other.column) &&
+                (table == other.table) &&
+                (columns == other.columns);
+    }
+};
+
+inline uint qHash (const StatementKey & key)
+{
+    uint result = qHash (key.table) ^ (uint(key.kind) << 24) ^
+            uint(key.column);
+    for (int i = 0; i < key.columns.size (); ++i) {
+        if (key.columns.testBit (i)) {
+            result = result * 31 + uint(i);
+        }
+    }
+    return result;
+}
+
+//! The queries prepared for one connection.
+struct Connection {
+    QSqlDriver * driver;
+    QHash<StatementKey, QSqlQuery *> queries;
+
+    ~Connection () {
+        qDeleteAll (queries);
+    }
+};
+
+//! The connections used by a thread, by name.
+class Connections : public QHash<QString, Connection *> {
+public:
+    ~Connections () {
+        qDeleteAll (*this);
+    }
+};
+
+QThreadStorage<Connections *> thread_connections;
+QAtomicInt hit_count;
+QAtomicInt miss_count;
+
+/* ------------------------------------------------------------------------- */
+/**
+ * Queries prepared for a connection that was closed or replaced since
+ * are dropped.
+ *
+ * @return the queries of a connection; NULL if there are none and
+ * @a b_create is false
+ */
+Connection * connectionFor (const QSqlDatabase & db, bool b_create)
+{
+    if (!thread_connections.hasLocalData ()) {
+        if (!b_create)
+            return NULL;
+        thread_connections.setLocalData (new Connections ());
+    }
+    Connections * connections = thread_connections.localData ();
+
+    QString name = db.connectionName ();
+    Connection * result = connections->value (name, NULL);
+    if ((result != NULL) &&
+            ((result->driver != db.driver ()) || !db.isOpen ())) {
+        connections->remove (name);
+        delete result;
+        result = NULL;
+    }
+    if ((result == NULL) && b_create) {
+        result = new Connection ();
+        result->driver = db.driver ();
+        connections->insert (name, result);
+    }
+    return result;
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+StatementKey keyFor (
+        const DbTaew * table, DbStatementCache::Kind kind, int column,
+        const QBitArray & columns)
+{
+    StatementKey result;
+    result.table = table->tableName ();
+    result.kind = kind;
+    result.column = kind == DbStatementCache::SELECT_BY_COLUMN ? column : -1;
+    if (kind == DbStatementCache::UPDATE_COLUMNS) {
+        result.columns = columns;
+    }
+    return result;
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+QSqlQuery * prepareQuery (QSqlDatabase & db, const QString & statement)
+{
+    DBSTRUCT_DEBUGM("%s\n", TMP_A(statement));
+    QSqlQuery * result = new QSqlQuery (db);
+    result->setForwardOnly (true);
+    if (!result->prepare (statement)) {
+        qWarning () << "prepare failed: " << statement;
+        qWarning () << result->lastError ().text ();
+        delete result;
+        return NULL;
+    }
+    return result;
+}
+/* ========================================================================= */
+
+} // namespace
+
+/* ------------------------------------------------------------------------- */
+/**
+ * The query belongs to the cache and may be handed out again as soon
+ * as the caller returns, so the caller should call `finish()` on it
+ * when done (DbCachedQuery does that).
+ *
+ * @param column the column used by SELECT_BY_COLUMN, ignored otherwise
+ * @param columns the columns (one bit per column index) written by
+ * UPDATE_COLUMNS, ignored otherwise
+ * @param b_hit set to true if the query was already prepared
+ * @return the query or NULL if it could not be prepared
+ */
+QSqlQuery * DbStatementCache::query (
+        QSqlDatabase & db, const DbTaew * table, Kind kind, int column,
+        const QBitArray & columns, bool * b_hit)
+{
+    Connection * connection = connectionFor (db, true);
+    StatementKey key = keyFor (table, kind, column, columns);
+    QSqlQuery * result = connection->queries.value (key, NULL);
+    if (b_hit != NULL) {
+        *b_hit = result != NULL;
+    }
+    if (result != NULL) {
+        hit_count.fetchAndAddRelaxed (1);
+        return result;
+    }
+
+    miss_count.fetchAndAddRelaxed (1);
+    result = prepareQuery (db, statement (table, kind, column, columns));
+    if (result != NULL) {
+        connection->queries.insert (key, result);
+    }
+    return result;
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+void DbStatementCache::discard (
+        const QSqlDatabase & db, const DbTaew * table, Kind kind, int column,
+        const QBitArray & columns)
+{
+    Connection * connection = connectionFor (db, false);
+    if (connection != NULL) {
+        delete connection->queries.take (
+                    keyFor (table, kind, column, columns));
+    }
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+void DbStatementCache::invalidate (const QSqlDatabase & db)
+{
+    if (thread_connections.hasLocalData ()) {
+        delete thread_connections.localData ()->take (db.connectionName ());
+    }
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+void DbStatementCache::close (QSqlDatabase & db)
+{
+    invalidate (db);
+    db.close ();
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+QString DbStatementCache::statement (
+        const DbTaew * table, Kind kind, int column,
+        const QBitArray & columns)
+{
+    switch (kind) {
+    case SELECT_BY_COLUMN: {
+        QString s_col_name = table->columnName (column);
+        return QString("SELECT %1 FROM %2 WHERE %3=:%4;\n")
+                .arg(table->commaColumns ())
+                .arg(table->tableName())
+                .arg(s_col_name)
+                .arg(s_col_name);
+    }
+    case INSERT:
+        return QString("INSERT INTO %1 (%2) VALUES (%3);")
+                .arg(table->modifyTableName())
+                .arg(table->commaColumnsNoId ())
+                .arg(table->columnColumns ());
+    case INSERT_WITH_ID: {
+        QString s_columns = table->commaColumns ();
+        return QString("INSERT INTO %1 (%2) VALUES (:%3);")
+                .arg(table->modifyTableName())
+                .arg(s_columns)
+                .arg(QString(s_columns).replace (
+                         QLatin1String(","), QLatin1String(",:")));
+    }
+    case UPDATE:
+        return QString("UPDATE %1 SET %2 WHERE %3 = :%4;\n")
+                .arg(table->modifyTableName())
+                .arg(table->assignColumns ())
+                .arg(table->columnName (table->idColumn ()))
+                .arg(table->columnName (table->idColumn ()));
+    case SELECT_ALL:
+        return QString("SELECT %1 FROM %2;\n")
+                .arg(table->commaColumns ())
+                .arg(table->tableName());
+    case UPDATE_COLUMNS: {
+        QString assign;
+        for (int i = 0; i < columns.size (); ++i) {
+            if (columns.testBit (i)) {
+                QString s_col_name = table->columnName (i);
+                if (!assign.isEmpty ()) {
+                    assign.append (QLatin1String(","));
+                }
+                assign.append (s_col_name + QLatin1String("=:") + s_col_name);
+            }
+        }
+        return QString("UPDATE %1 SET %2 WHERE %3 = :%4;\n")
+                .arg(table->modifyTableName())
+                .arg(assign)
+                .arg(table->columnName (table->idColumn ()))
+                .arg(table->columnName (table->idColumn ()));
+    }
+    case MAX_ID:
+        return QString("SELECT MAX(%1) FROM %2;\n")
+                .arg(table->columnName (table->idColumn ()))
+                .arg(table->modifyTableName());
+    default:
+        DBG_ASSERT(false);
+        return QString();
+    }
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+int DbStatementCache::hits ()
+{
+    return hit_count.fetchAndAddRelaxed (0);
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+int DbStatementCache::misses ()
+{
+    return miss_count.fetchAndAddRelaxed (0);
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+void DbStatementCache::resetCounters ()
+{
+    hit_count.fetchAndStoreRelaxed (0);
+    miss_count.fetchAndStoreRelaxed (0);
+}
+/* ========================================================================= */
+
+/**
+ * @class DbCachedQuery
+ *
+ * A cached query that is still active belongs to a caller further up
+ * the stack (a `retrieve()` that loads another record of the same
+ * table, for example). In that case a separate query is prepared for
+ * this scope so the one in use is left alone.
+ */
+
+/* ------------------------------------------------------------------------- */
+DbCachedQuery::DbCachedQuery (
+        QSqlDatabase & db, const DbTaew * table,
+        DbStatementCache::Kind kind, int column, const QBitArray & columns) :
+    db_(db),
+    table_(table),
+    kind_(kind),
+    column_(column),
+    columns_(columns),
+    query_(NULL),
+    b_hit_(false),
+    b_owned_(false)
+{
+    query_ = DbStatementCache::query (
+                db, table, kind, column, columns, &b_hit_);
+    if ((query_ != NULL) && query_->isActive ()) {
+        b_hit_ = false;
+        b_owned_ = true;
+        query_ = prepareQuery (
+                    db, DbStatementCache::statement (
+                        table, kind, column, columns));
+    }
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+DbCachedQuery::~DbCachedQuery ()
+{
+    if (b_owned_) {
+        delete query_;
+    } else if (query_ != NULL) {
+        query_->finish ();
+    }
+}
+/* ========================================================================= */
+
+/* ------------------------------------------------------------------------- */
+/**
+ * A query prepared before a connection was closed and opened again can
+ * no longer be executed. Only a query taken from the cache as it was is
+ * renewed, and only once; a failure of a fresh query is a real one.
+ *
+ * @return true if a new query was prepared and should be tried
+ */
+bool DbCachedQuery::renew ()
+{
+    if (!b_hit_)
+        return false;
+    b_hit_ = false;
+    DbStatementCache::discard (db_, table_, kind_, column_, columns_);
+    query_ = DbStatementCache::query (
+                db_, table_, kind_, column_, columns_);
+    return query_ != NULL;
+}
+/* ========================================================================= */
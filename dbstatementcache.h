@@ -0,0 +1,152 @@
+/**
+ * @file dbstatementcache.h
+ * @brief Declarations for DbStatementCache class
+ * @author Nicu Tofan <nicu.tofan@gmail.com>
+ * @copyright Copyright 2015 piles contributors. All rights reserved.
+ * This file is released under the
+ * [MIT License](http://opensource.org/licenses/mit-license.html)
+ */
+
+#ifndef GUARD_DBSTATEMENTCACHE_H_INCLUDE
+#define GUARD_DBSTATEMENTCACHE_H_INCLUDE
+
+#include <dbstruct/dbstruct-config.h>
+
+#include <QBitArray>
+#include <QString>
+
+QT_BEGIN_NAMESPACE
+class QSqlDatabase;
+class QSqlQuery;
+QT_END_NAMESPACE
+
+class DbTaew;
+
+//! Prepared queries used by records, kept for each database connection.
+class DBSTRUCT_EXPORT DbStatementCache {
+
+public:
+
+    //! The statements that are cached.
+    enum Kind {
+        SELECT_BY_COLUMN, /**< all columns of the rows matching a column */
+        INSERT, /**< a new row with all columns except the id */
+        UPDATE, /**< all columns of the row with a given id */
+        SELECT_ALL, /**< all columns of all rows */
+        UPDATE_COLUMNS, /**< some columns of the row with a given id */
+        INSERT_WITH_ID, /**< a new row with all columns, the id included */
+        MAX_ID, /**< the largest id in the table */
+
+        KIND_MAX /**< number of kinds */
+    };
+
+    //! Get the prepared query for a statement, preparing it on first use.
+    static QSqlQuery *
+    query (
+            QSqlDatabase & db,
+            const DbTaew * table,
+            Kind kind,
+            int column = -1,
+            const QBitArray & columns = QBitArray(),
+            bool * b_hit = NULL);
+
+    //! Forget the query for a statement.
+    static void
+    discard (
+            const QSqlDatabase & db,
+            const DbTaew * table,
+            Kind kind,
+            int column = -1,
+            const QBitArray & columns = QBitArray());
+
+    //! Forget all the queries prepared for a connection.
+    static void
+    invalidate (
+            const QSqlDatabase & db);
+
+    //! Forget the queries prepared for a connection and close it.
+    static void
+    close (
+            QSqlDatabase & db);
+
+    //! The text of a statement.
+    static QString
+    statement (
+            const DbTaew * table,
+            Kind kind,
+            int column = -1,
+            const QBitArray & columns = QBitArray());
+
+    //! Number of requests served by an already prepared query.
+    static int
+    hits ();
+
+    //! Number of requests that had to prepare a query.
+    static int
+    misses ();
+
+    //! Set the hits and misses to zero.
+    static void
+    resetCounters ();
+
+}; /* class DbStatementCache */
+
+
+//! A query taken from DbStatementCache for the length of a scope.
+class DBSTRUCT_EXPORT DbCachedQuery {
+
+    QSqlDatabase & db_; /**< the connection */
+    const DbTaew * table_; /**< the table or view */
+    DbStatementCache::Kind kind_; /**< the statement */
+    int column_; /**< the column used by the statement */
+    QBitArray columns_; /**< the columns used by the statement */
+    QSqlQuery * query_; /**< the query, NULL if it could not be prepared */
+    bool b_hit_; /**< the query was prepared before this scope */
+    bool b_owned_; /**< the query is not part of the cache */
+
+public:
+
+    //! Constructor.
+    DbCachedQuery (
+            QSqlDatabase & db,
+            const DbTaew * table,
+            DbStatementCache::Kind kind,
+            int column = -1,
+            const QBitArray & columns = QBitArray());
+
+    //! Destructor; releases the result set.
+    ~DbCachedQuery ();
+
+    //! Tell if the query was prepared.
+    inline bool
+    isValid () const {
+        return query_ != NULL;
+    }
+
+    //! Prepare a cached query again after it failed.
+    bool
+    renew ();
+
+    //! Access the query.
+    inline QSqlQuery &
+    operator* () const {
+        return *query_;
+    }
+
+    //! Access the query.
+    inline QSqlQuery *
+    operator-> () const {
+        return query_;
+    }
+
+private:
+
+    //! No copies.
+    DbCachedQuery (const DbCachedQuery &);
+
+    //! No assignments.
+    DbCachedQuery & operator= (const DbCachedQuery &);
+
+}; /* class DbCachedQuery */
+
+#endif // GUARD_DBSTATEMENTCACHE_H_INCLUDE
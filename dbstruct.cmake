@@ -21,6 +21,8 @@ macro    (dbstructInit
         "dbobject.h"
         "dbtaew.h"
         "dbrecord.h"
+        "dbstatementcache.h"
+        "dbcursor.h"
         "dbview.h"
         "dbcolumn.h"
         "dbtable.h"
@@ -29,6 +31,8 @@ macro    (dbstructInit
         "dbobject.cc"
         "dbtaew.cc"
         "dbrecord.cc"
+        "dbstatementcache.cc"
+        "dbcursor.cc"
         "dbview.cc"
         "dbcolumn.cc"
         "dbtable.cc"
@@ -62,6 +66,94 @@ endmacro ()
 
 # ============================================================================
 
+# Create a target that runs the generator
+#
+# The generator runs right away, so CMake finds the files it
+# generates, and lists them in <target>.outputs. With CMake 3.20 (3.7
+# for Ninja) they are the BYPRODUCTS of a custom command that passes
+# --depfile, so the build runs the generator again only when one of
+# the files it read (the input, included files, the schema, the
+# templates) changed. Its OUTPUT is a stamp file touched by each run,
+# as unchanged files are not written again. Older versions run the
+# generator each time the target is built.
+#
+macro    (dbstructAddGenerator
+          dbstruct__gen_target
+          dbstruct__gen_cmd
+          dbstruct__gen_sources)
+
+    set(dbstruct__depfile
+        "${CMAKE_CURRENT_BINARY_DIR}/${dbstruct__gen_target}.d")
+    set(dbstruct__outputs
+        "${CMAKE_CURRENT_BINARY_DIR}/${dbstruct__gen_target}.outputs")
+    set(dbstruct__stamp
+        "${CMAKE_CURRENT_BINARY_DIR}/${dbstruct__gen_target}.stamp")
+
+    execute_process(
+        COMMAND ${dbstruct__gen_cmd} "--outputs=${dbstruct__outputs}"
+        WORKING_DIRECTORY
+            "${CMAKE_CURRENT_BINARY_DIR}"
+            OUTPUT_QUIET)
+
+    unset(dbstruct__use_depfile)
+    if (NOT CMAKE_VERSION VERSION_LESS 3.20)
+        set(dbstruct__use_depfile ON)
+    elseif (NOT CMAKE_VERSION VERSION_LESS 3.7 AND
+            CMAKE_GENERATOR MATCHES "Ninja")
+        set(dbstruct__use_depfile ON)
+    endif ()
+
+    if (dbstruct__use_depfile AND EXISTS "${dbstruct__outputs}")
+        file(STRINGS "${dbstruct__outputs}" dbstruct__generated)
+        # the depfile holds absolute paths; Ninja needs CMake to make
+        # them relative to the build directory
+        cmake_policy(PUSH)
+        if (POLICY CMP0116)
+            cmake_policy(SET CMP0116 NEW)
+        endif ()
+        add_custom_command(
+            OUTPUT
+                "${dbstruct__stamp}"
+            BYPRODUCTS
+                ${dbstruct__generated}
+            COMMAND
+                ${dbstruct__gen_cmd}
+                "--depfile=${dbstruct__depfile}"
+                "--outputs=${dbstruct__outputs}"
+                "--stamp=${dbstruct__stamp}"
+            DEPENDS
+                "${DBSTRUCT_SOURCE_DIR}/pileschema.py"
+            DEPFILE
+                "${dbstruct__depfile}"
+            WORKING_DIRECTORY
+                "${CMAKE_CURRENT_BINARY_DIR}"
+            COMMENT "Expanding Sql models"
+            VERBATIM)
+        cmake_policy(POP)
+        add_custom_target(
+            "${dbstruct__gen_target}"
+            DEPENDS
+                "${dbstruct__stamp}"
+            SOURCES
+                ${dbstruct__gen_sources})
+    else ()
+        add_custom_target(
+            "${dbstruct__gen_target}"
+            ${dbstruct__gen_cmd}
+            DEPENDS
+                ${dbstruct__gen_sources}
+            WORKING_DIRECTORY
+                "${CMAKE_CURRENT_BINARY_DIR}"
+            COMMENT "Expanding Sql models"
+            VERBATIM
+            SOURCES
+                ${dbstruct__gen_sources})
+    endif ()
+
+endmacro ()
+
+# ============================================================================
+
 # Create a target that generates .sql from .xml
 #
 # The command that will be execute will resemble
@@ -84,28 +176,10 @@ macro    (dbstructModelToSql
         "${dbstruct__xml}"
         "${dbstruct__output}")
 
-    add_custom_target(
+    dbstructAddGenerator(
         "${dbstruct__target}"
-        ${dbstruct__cmd}
-        DEPENDS
-            "${DBSTRUCT_SOURCE_DIR}/pileschema.py"
-            "${dbstruct__xml}"
-        WORKING_DIRECTORY
-            "${CMAKE_CURRECT_BINARY_DIR}"
-        COMMENT "Expanding Sql models"
-        VERBATIM
-        SOURCES
-            "${DBSTRUCT_SOURCE_DIR}/pileschema.py"
-            "${dbstruct__xml}")
-
-    # also generate this right now so CMake finds files
-    # generated by this process
-
-    execute_process(
-        COMMAND "${dbstruct__cmd}"
-        WORKING_DIRECTORY
-            "${CMAKE_CURRECT_BINARY_DIR}"
-            OUTPUT_QUIET)
+        "${dbstruct__cmd}"
+        "${DBSTRUCT_SOURCE_DIR}/pileschema.py;${dbstruct__xml}")
 
 endmacro ()
 
@@ -144,36 +218,27 @@ macro    (dbstructModelToQt
         "--schema=${DBSTRUCT_SOURCE_DIR}/PileSchema.xsd"
         "--templates=${dbstruct__template_used}"
         "--exportm=${dbstruct__export}"
-        "--importh=${dbstruct__include}"
+        "--importh=${dbstruct__include}")
+    # with DBSTRUCT_UNITY_CHUNKS set the generated sources are compiled
+    # through that many unity build sources, listed in the
+    # <database>-sources.cmake file found in the output directory
+    if (DBSTRUCT_UNITY_CHUNKS)
+        list(APPEND dbstruct__cmd
+            "--unity-chunks=${DBSTRUCT_UNITY_CHUNKS}")
+    endif()
+    # with DBSTRUCT_REPRODUCIBLE set the generated files do not change
+    # with the date (unless SOURCE_DATE_EPOCH is set) or the user
+    if (DBSTRUCT_REPRODUCIBLE)
+        list(APPEND dbstruct__cmd "--reproducible")
+    endif()
+    list(APPEND dbstruct__cmd
         "${dbstruct__xml}"
         "${dbstruct__output}")
 
-    add_custom_target(
+    dbstructAddGenerator(
         "${dbstruct__target}"
-        ${dbstruct__cmd}
-        DEPENDS
-            "${DBSTRUCT_SOURCE_DIR}/pileschema.py"
-            "${dbstruct__xml}"
-            "${DBSTRUCT_TEMPLATE_H}"
-            "${DBSTRUCT_TEMPLATE_CC}"
-        WORKING_DIRECTORY
-            "${CMAKE_CURRECT_BINARY_DIR}"
-        COMMENT "Expanding Sql models"
-        VERBATIM
-        SOURCES
-            "${DBSTRUCT_SOURCE_DIR}/pileschema.py"
-            "${dbstruct__xml}"
-            "${DBSTRUCT_TEMPLATE_H}"
-            "${DBSTRUCT_TEMPLATE_CC}")
-
-    # also generate this right now so CMake finds files
-    # generated by this process
-
-    execute_process(
-        COMMAND "${dbstruct__cmd}"
-        WORKING_DIRECTORY
-            "${CMAKE_CURRECT_BINARY_DIR}"
-            OUTPUT_QUIET)
+        "${dbstruct__cmd}"
+        "${DBSTRUCT_SOURCE_DIR}/pileschema.py;${dbstruct__xml};${DBSTRUCT_TEMPLATE_H};${DBSTRUCT_TEMPLATE_CC}")
 
 endmacro ()
 
@@ -46,11 +46,15 @@ DbTaew::~DbTaew()
 /* ------------------------------------------------------------------------- */
 bool DbTaew::hasColumn (const QString &s_name) const
 {
-    return columns().contains (s_name, Qt::CaseInsensitive);
+    return columnIndex (s_name) != -1;
 }
 /* ========================================================================= */
 
 /* ------------------------------------------------------------------------- */
+/**
+ * The generated classes replace this scan of columns() with a lookup
+ * in a sorted table of their column names.
+ */
 int DbTaew::columnIndex (const QString &s_name) const
 {
     return columns().indexOf (s_name, Qt::CaseInsensitive);
@@ -43,7 +43,7 @@ public:
             const QString & s_name) const;
 
     //! Tell the index of a column in this table.
-    int
+    virtual int
     columnIndex (
             const QString & s_name) const;
 
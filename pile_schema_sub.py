@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+'''
+Subclasses for the classes generated by generateDS in `pile_schema_api`.
+
+generateDS classes create their instances through `factory()`, which
+uses the `subclass` attribute of the class when set. Importing this
+module installs the subclasses below so that any tree built by
+`pile_schema_api` uses them, while `pile_schema_api.py` itself can still
+be regenerated from `PileSchema.xsd` at any time. Classes that have no
+subclass of their own get one that binds xml attributes in a single pass.
+
+`compact_model()` and `lazy_model()` provide other flavours of the same
+classes for very large schemas: one that is memory-compact and one that
+only converts the parts of the document that are actually accessed.
+
+'''
+
+import keyword
+import types
+
+import pile_schema_api as supermod
+
+# Names of the modules returned by `compact_model()` and `lazy_model()`.
+COMPACT_MODULE = 'pile_schema_compact'
+LAZY_MODULE = 'pile_schema_lazy'
+
+# The modules created so far, by name.
+_MODELS = {}
+
+# Members of `column` whose name differs from the tag of the element
+# (see `--cleanup-name-list` in the header of `pile_schema_api`).
+TAG_RENAMES = {
+    'integer': 'int',
+    'float_': 'float',
+}
+
+# Maps the tag of each datatype element allowed inside a `column`
+# to the name of the member that stores it.
+DATATYPE_MEMBERS = dict(
+    (TAG_RENAMES.get(name, name), name)
+    for name, spec in supermod.column.member_data_items_.items()
+    if not spec.get_data_type().startswith('xs:'))
+
+# The base type of the simple types declared in PileSchema.xsd; the
+# generated code checks values of these types with `validate_<type>`.
+SIMPLE_TYPES = {
+    'tristateValues': 'xs:string',
+    'GUID': 'xs:string',
+    'charLength': 'xs:string',
+    'ncharLength': 'xs:string',
+    'sortOrder': 'xs:string',
+    'mantissaBits': 'xs:integer',
+    'fractionalSecondsPrecision': 'xs:integer',
+    'moneydefault': 'xs:decimal',
+    'smallmoneyDefault': 'xs:decimal',
+}
+
+# The members of simple type that hold an element, not an attribute;
+# `member_data_items_` describes both the same way.
+SIMPLE_ELEMENTS = {
+    'database': ('sqlPrefix', 'sqlSuffix'),
+}
+
+# Values accepted for xs:boolean attributes.
+BOOLEAN_VALUES = {
+    'true': True,
+    '1': True,
+    'false': False,
+    '0': False,
+}
+
+# ----------------------------------------------------------------------------
+
+class columnSub(supermod.column):
+    '''
+    A column that remembers which datatype element it contains.
+
+    `datatype_name_` is the name of the member holding the datatype
+    (empty if none was seen) and `datatype_` is the datatype itself.
+    '''
+    def __init__(self, *args_, **kwargs_):
+        super(columnSub, self).__init__(*args_, **kwargs_)
+        self.datatype_name_ = ''
+        self.datatype_ = None
+
+    def buildChildren(self, child_, node, nodeName_, fromsubclass_=False):
+        super(columnSub, self).buildChildren(
+            child_, node, nodeName_, fromsubclass_)
+        member = DATATYPE_MEMBERS.get(nodeName_)
+        if member is not None:
+            self.datatype_name_ = member
+            self.datatype_ = getattr(self, member)
+
+supermod.column.subclass = columnSub
+
+# ----------------------------------------------------------------------------
+
+def _to_bool(obj, value, node):
+    '''Converts the value of an xs:boolean attribute.'''
+    try:
+        return BOOLEAN_VALUES[value]
+    except KeyError:
+        supermod.raise_parse_error(node, 'Bad boolean attribute')
+
+def _to_int(obj, value, node):
+    '''Converts the value of an integer attribute.'''
+    try:
+        return int(value)
+    except ValueError as exp:
+        supermod.raise_parse_error(node, 'Bad integer attribute: %s' % exp)
+
+def _to_float(obj, value, node):
+    '''Converts the value of an xs:decimal attribute.'''
+    try:
+        return float(value)
+    except ValueError as exp:
+        raise ValueError('Bad float/double attribute (default): %s' % exp)
+
+def _to_date(obj, value, node):
+    '''Converts the value of an xs:date attribute.'''
+    try:
+        return obj.gds_parse_date(value)
+    except ValueError as exp:
+        raise ValueError('Bad date attribute (default): %s' % exp)
+
+def _to_time(obj, value, node):
+    '''Converts the value of an xs:time attribute.'''
+    try:
+        return obj.gds_parse_time(value)
+    except ValueError as exp:
+        raise ValueError('Bad time attribute (default): %s' % exp)
+
+# Converter for the values of each xs: type; strings are kept as they are.
+CONVERTERS = {
+    'xs:string': None,
+    'xs:boolean': _to_bool,
+    'xs:byte': _to_int,
+    'xs:short': _to_int,
+    'xs:int': _to_int,
+    'xs:integer': _to_int,
+    'xs:long': _to_int,
+    'xs:unsignedShort': _to_int,
+    'xs:decimal': _to_float,
+    'xs:date': _to_date,
+    'xs:time': _to_time,
+}
+
+# ----------------------------------------------------------------------------
+
+def _attribute_bindings(cls):
+    '''
+    Maps the name of each xml attribute of a generated class to the
+    member that stores it, its converter and the name of the method
+    that validates it (or None).
+
+    Returns None for classes that take part in type extension
+    (`xsi:type`, attributes inherited from a base); those keep the
+    generated `buildAttributes`.
+    '''
+    if cls.superclass is not None or hasattr(cls, 'get_extensiontype_'):
+        return None
+
+    # the members holding elements of complex type name their class;
+    # the ones of simple type are attributes unless listed as elements
+    elements = SIMPLE_ELEMENTS.get(cls.__name__, ())
+    bindings = {}
+    for name, spec in cls.member_data_items_.items():
+        data_type = spec.get_data_type()
+        if name in elements or not (
+                data_type.startswith('xs:') or data_type in SIMPLE_TYPES):
+            continue
+        validator = None
+        if data_type in SIMPLE_TYPES:
+            validator = 'validate_' + data_type
+            data_type = SIMPLE_TYPES[data_type]
+        if data_type not in CONVERTERS:
+            # a type this module does not know about
+            return None
+        member = name + '_' if keyword.iskeyword(name) else name
+        bindings[name] = (member, CONVERTERS[data_type], validator)
+    return bindings
+
+# ----------------------------------------------------------------------------
+
+def _fast_build_attributes(bindings):
+    '''
+    A `buildAttributes` that makes a single pass over the attributes of
+    the element, instead of looking up each declared attribute in turn.
+
+    `already_processed` is ignored; it only matters when the
+    `buildAttributes` of a base class runs after that of a derived one,
+    which `_attribute_bindings` rules out.
+    '''
+    def buildAttributes(self, node, attrs, already_processed):
+        for name, value in attrs.items():
+            binding = bindings.get(name)
+            if binding is None:
+                continue
+            member, convert, validator = binding
+            if convert is not None:
+                value = convert(self, value, node)
+            setattr(self, member, value)
+            if validator is not None:
+                getattr(self, validator)(value)
+    return buildAttributes
+
+# ----------------------------------------------------------------------------
+
+def _install_fast_attributes():
+    '''
+    Makes `factory()` create instances that use `_fast_build_attributes`
+    for all generated classes where it applies.
+    '''
+    for name in supermod.__all__:
+        cls = getattr(supermod, name)
+        bindings = _attribute_bindings(cls)
+        if bindings is None:
+            continue
+        if cls.subclass is None:
+            cls.subclass = type(name + 'Sub', (cls,), {})
+        cls.subclass.buildAttributes = _fast_build_attributes(bindings)
+
+_install_fast_attributes()
+
+# ----------------------------------------------------------------------------
+
+def _rebind(value, namespace):
+    '''
+    Returns a copy of a function (or of the function wrapped by a
+    static or class method) that resolves globals in `namespace`.
+    '''
+    if isinstance(value, staticmethod):
+        return staticmethod(_rebind(value.__func__, namespace))
+    if isinstance(value, classmethod):
+        return classmethod(_rebind(value.__func__, namespace))
+    if isinstance(value, types.FunctionType):
+        result = types.FunctionType(
+            value.__code__, namespace, value.__name__,
+            value.__defaults__, value.__closure__)
+        result.__doc__ = value.__doc__
+        return result
+    return value
+
+# ----------------------------------------------------------------------------
+
+def _class_attrs(cls, namespace):
+    '''
+    Copies the content of a generated class for use in another model.
+
+    Methods are copied with their globals resolved in `namespace` so
+    that the code generated for one class creates (and calls `super`
+    on) the classes of the same model.
+    '''
+    attrs = {}
+    for key, value in cls.__dict__.items():
+        if key in ('__dict__', '__weakref__'):
+            continue
+        attrs[key] = _rebind(value, namespace)
+    attrs['__module__'] = namespace['__name__']
+    if cls is not supermod.GeneratedsSuper:
+        attrs['subclass'] = None
+        if cls.superclass is not None:
+            attrs['superclass'] = namespace[cls.superclass.__name__]
+        bindings = _attribute_bindings(cls)
+        if bindings is not None:
+            attrs['buildAttributes'] = _fast_build_attributes(bindings)
+    return attrs
+
+# ----------------------------------------------------------------------------
+
+def _class_bases(cls, namespace):
+    '''
+    The bases of a generated class in the model described by `namespace`.
+    '''
+    return tuple(
+        base if base is object else namespace[base.__name__]
+        for base in cls.__bases__)
+
+# ----------------------------------------------------------------------------
+
+def _datatype_property(name):
+    '''
+    A `column` member that is stored in `datatype_` only while it is
+    the datatype of the column, so unset datatypes take no space.
+    '''
+    def getter(self):
+        if self.datatype_name_ == name:
+            return self.datatype_
+        return None
+
+    def setter(self, value):
+        if value is not None:
+            self.datatype_name_ = name
+            self.datatype_ = value
+        elif self.datatype_name_ == name:
+            self.datatype_name_ = ''
+            self.datatype_ = None
+
+    return property(getter, setter)
+
+# ----------------------------------------------------------------------------
+
+def _column_init(init):
+    '''
+    Wraps the constructor of a `column` so that the datatype members
+    are valid before the generated code assigns the others.
+    '''
+    def __init__(self, *args_, **kwargs_):
+        self.datatype_name_ = ''
+        self.datatype_ = None
+        init(self, *args_, **kwargs_)
+    return __init__
+
+# ----------------------------------------------------------------------------
+
+def _column_build_children(build_children):
+    '''
+    Wraps `buildChildren` of a `column` to record the datatype element
+    the same way `columnSub` does.
+    '''
+    def buildChildren(self, child_, node, nodeName_, fromsubclass_=False):
+        build_children(self, child_, node, nodeName_, fromsubclass_)
+        member = DATATYPE_MEMBERS.get(nodeName_)
+        if member is not None:
+            self.datatype_name_ = member
+            self.datatype_ = getattr(self, member)
+    return buildChildren
+
+# ----------------------------------------------------------------------------
+
+def _compact_class(cls, namespace):
+    '''
+    Creates the `__slots__` based equivalent of a generated class.
+    '''
+    attrs = _class_attrs(cls, namespace)
+    bases = _class_bases(cls, namespace)
+
+    if cls is supermod.GeneratedsSuper:
+        slots = set()
+    else:
+        # the generated constructors only take default arguments, so an
+        # instance tells which members each class stores
+        slots = set(vars(cls()))
+        for base in bases:
+            slots.difference_update(getattr(base, '__slots__', ()))
+
+    if cls is supermod.column:
+        for name in DATATYPE_MEMBERS.values():
+            slots.discard(name)
+            attrs[name] = _datatype_property(name)
+        slots.update(('datatype_name_', 'datatype_'))
+        attrs['__init__'] = _column_init(attrs['__init__'])
+
+    attrs['__slots__'] = tuple(sorted(slots))
+    return type(cls.__name__, bases, attrs)
+
+# ----------------------------------------------------------------------------
+
+def _lazy_methods(init, build):
+    '''
+    The constructor, `build` and `__getattr__` of a lazy class.
+
+    `build` only remembers the xml element. The first access to any
+    member runs the generated constructor and `build` on that element,
+    which creates (equally lazy) objects for its direct children, and
+    the result is kept in the instance from then on.
+    '''
+    def __init__(self, *args_, **kwargs_):
+        if args_ or kwargs_:
+            init(self, *args_, **kwargs_)
+        else:
+            self.lazy_node_ = None
+
+    def lazy_build(self, node):
+        self.lazy_node_ = node
+        return self
+
+    def __getattr__(self, name):
+        # only called for names that are not in the instance yet
+        if name.startswith('__') or 'lazy_node_' not in self.__dict__:
+            raise AttributeError(name)
+        state = self.__dict__.copy()
+        node = state.pop('lazy_node_')
+        self.__dict__.clear()
+        init(self)
+        if node is not None:
+            build(self, node)
+        # keep what was set from outside (original_tagname_, ...)
+        self.__dict__.update(state)
+        return getattr(self, name)
+
+    return __init__, lazy_build, __getattr__
+
+# ----------------------------------------------------------------------------
+
+def _lazy_class(cls, namespace):
+    '''
+    Creates the equivalent of a generated class that is built from its
+    xml element on first access.
+    '''
+    attrs = _class_attrs(cls, namespace)
+    bases = _class_bases(cls, namespace)
+    if cls is not supermod.GeneratedsSuper:
+        init = attrs['__init__']
+        if cls is supermod.column:
+            init = _column_init(init)
+            attrs['buildChildren'] = _column_build_children(
+                attrs['buildChildren'])
+        attrs['__init__'], attrs['build'], attrs['__getattr__'] = \
+            _lazy_methods(init, attrs['build'])
+    return type(cls.__name__, bases, attrs)
+
+# ----------------------------------------------------------------------------
+
+def _derived_model(name, make_class):
+    '''
+    Returns a module equivalent to `pile_schema_api` where each class is
+    replaced by the result of `make_class`.
+
+    The module is created on first use; its `parse`, `parseString`,
+    `get_root_tag`, ... functions and the `factory` methods of its
+    classes all create instances of its own classes.
+    '''
+    if name in _MODELS:
+        return _MODELS[name]
+
+    module = types.ModuleType(name, supermod.__doc__)
+    namespace = module.__dict__
+    namespace.update(vars(supermod))
+    namespace['__name__'] = name
+
+    classes = [supermod.GeneratedsSuper] + sorted(
+        (getattr(supermod, name) for name in supermod.__all__),
+        key=lambda cls: len(cls.__mro__))
+    for cls in classes:
+        namespace[cls.__name__] = make_class(cls, namespace)
+
+    for key, value in vars(supermod).items():
+        if isinstance(value, types.FunctionType):
+            namespace[key] = _rebind(value, namespace)
+    namespace['GDSClassesMapping'] = dict(
+        (key, namespace[value.__name__])
+        for key, value in supermod.GDSClassesMapping.items())
+
+    _MODELS[name] = module
+    return module
+
+# ----------------------------------------------------------------------------
+
+def compact_model():
+    '''
+    Returns a module equivalent to `pile_schema_api` whose classes use
+    `__slots__` instead of a per-instance `__dict__`.
+    '''
+    return _derived_model(COMPACT_MODULE, _compact_class)
+
+# ----------------------------------------------------------------------------
+
+def lazy_model():
+    '''
+    Returns a module equivalent to `pile_schema_api` whose objects are
+    resolved from the underlying lxml elements on first access.
+
+    Only the objects whose members are read are ever converted. An
+    object keeps a reference to its element until then, so the xml tree
+    stays in memory while any object has not been read.
+    '''
+    return _derived_model(LAZY_MODULE, _lazy_class)
@@ -13,12 +13,25 @@ Basic usage:
 import argparse
 from collections import OrderedDict
 import datetime
+import glob
+import hashlib
+import json
+import keyword
 import logging
 from lxml import etree
+import multiprocessing
 import os
 import platform
+import re
+import sys
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 import pile_schema_api
+import pile_schema_sub
 
 if platform.system() == 'Windows':
     import win32api
@@ -33,12 +46,34 @@ else:
         return pwd.getpwuid(os.getuid())[0]
 
 PARSER = None
+MODEL = pile_schema_api
+SCHEMA = None
 SCHEMA_FILE = None
+COMPILED_SCHEMAS = {}
+VALIDATE_CACHE_DIR = None
+MANIFEST_FILE = '.pileschema-manifest.json' # kept in the output directory
+MANIFEST_VERSION = 3 # change when the fingerprints are computed differently
+RENDER_DRIVER = None # the QtDriver of a worker process
+SCHEMA_DIGEST = None # sha1 of the content of SCHEMA_FILE
+PARSED_CACHE_VERSION = 1 # change when the layout of cached data changes
+TEMPLATE_CACHE_VERSION = 1 # change when templates are compiled differently
+# The compiled templates of this process, by file name
+COMPILED_TEMPLATES = {}
+# A variable in a template or an escaped percent sign
+TEMPLATE_SLOT = re.compile(r'%(?:\(([^)]*)\)s|%)')
+# The types of members that hold `pile_schema_api` objects
+ELEMENT_TYPES = set(pile_schema_api.__all__).union(
+    pile_schema_sub.TAG_RENAMES.values())
 AUTHOR = None
+BUILD_DATE = None # the date in generated files (None leaves it out)
+INPUT_FILES = [] # the files read by the current command
 META_TABLE_BASE = 'DbTable' # The base class for Meta Tables
 RECORD_BASE = 'DbRecord' # The base class for Tables
 META_TABLE_BASE_FILE = '#include <dbstruct/dbtable.h>' # include files for Meta Table file
 DEFAULT_SCHEMA_FILE = './PileSchema.xsd'
+XSD_NSPACE = 'http://www.w3.org/2001/XMLSchema'
+XINCLUDE_NSPACE = 'http://www.w3.org/2001/XInclude'
+PILE_NSPACE = 'http://pile-contributors.github.io/database/PileSchema.xsd'
 NSPACESTR = None
 LOGGER = logging.getLogger('PileSchema')
 FROM_VARIANT = {
@@ -140,8 +175,9 @@ class Driver(object):
     Sql variant.
     '''
     def __init__(self):
-        self.views = {}
-        self.tables = {}
+        # ordered, as the output lists them in the order of the input
+        self.views = OrderedDict()
+        self.tables = OrderedDict()
         super(Driver, self).__init__()
 
     def database_start(self, name, node):
@@ -239,22 +275,31 @@ class SqlDriver(Driver):
     '''
     Default implementation with regard to the underlying
     Sql variant.
+
+    The statements are collected as a list of lines in `sql_lines`;
+    `sql_string` joins them.
     '''
     def __init__(self):
-        self.sql_string = ''
-        self.foreign_keys = {}
+        self.sql_lines = []
+        self.foreign_keys = OrderedDict()
         super(SqlDriver, self).__init__()
 
+    @property
+    def sql_string(self):
+        '''The generated sql'''
+        return ''.join(self.sql_lines)
+
     def table_start(self, name, node):
         '''Starting to process table `name`'''
-        self.sql_string += 'CREATE TABLE IF NOT EXISTS `' + name + '` (\n'
-        self.foreign_keys = {}
+        self.sql_lines.append('CREATE TABLE IF NOT EXISTS `' + name + '` (\n')
+        self.foreign_keys = OrderedDict()
 
     def database_end(self, name, node):
         '''Done processing database `name.`'''
         #print node.sqlPrefix
         #print node.sqlSuffix
-        self.sql_string = node.sqlPrefix + self.sql_string + node.sqlSuffix
+        self.sql_lines.insert(0, node.sqlPrefix)
+        self.sql_lines.append(node.sqlSuffix)
 
     def table_end(self, name, node):
         '''Done processing table `name`'''
@@ -264,17 +309,17 @@ class SqlDriver(Driver):
             pkey = None
 
         if pkey is not None:
-            self.sql_string += '  PRIMARY KEY (`' + pkey.name + '`),\n'
+            self.sql_lines.append('  PRIMARY KEY (`' + pkey.name + '`),\n')
         for fkey in self.foreign_keys:
             fdata = self.foreign_keys[fkey]
-            self.sql_string += '  FOREIGN KEY(' + fkey + ') REFERENCES ' + \
-                fdata[0] + '(' + fdata[1] + '),\n'
+            self.sql_lines.append('  FOREIGN KEY(' + fkey + ') REFERENCES ' +
+                                  fdata[0] + '(' + fdata[1] + '),\n')
 
-        if (self.sql_string[-2] == ',') and (self.sql_string[-1] == '\n'):
+        if self.sql_lines[-1].endswith(',\n'):
             # get rid of last comma
-            self.sql_string = self.sql_string[:-2] + '\n'
+            self.sql_lines[-1] = self.sql_lines[-1][:-2] + '\n'
 
-        self.sql_string += ');\n'
+        self.sql_lines.append(');\n')
 
     def column(self, name, label, datatype, nulls, node, dtnode):
         '''Processing a column'''
@@ -284,16 +329,16 @@ class SqlDriver(Driver):
             return
 
         # first comes the name
-        self.sql_string += '  `' + name + '` '
+        parts = ['  `' + name + '`']
         # then the datatype
         try:
             length = dtnode.length
         except AttributeError:
             length = None
         if length:
-            self.sql_string += SQL_DATATYPES[datatype] + '(' + length + ') '
+            parts.append(SQL_DATATYPES[datatype] + '(' + length + ')')
         else:
-            self.sql_string += SQL_DATATYPES[datatype] + ' '
+            parts.append(SQL_DATATYPES[datatype])
         # any defaults
         try:
             defval = dtnode.default
@@ -304,23 +349,21 @@ class SqlDriver(Driver):
         except AttributeError:
             defexpr = defval
         if defval:
-            self.sql_string += 'DEFAULT ' + str(defval) + ' '
+            parts.append('DEFAULT ' + str(defval))
         elif defexpr:
-            self.sql_string += 'DEFAULT ' + defexpr + ' '
+            parts.append('DEFAULT ' + defexpr)
         # null constraint
         if not nulls:
-            self.sql_string += 'NOT NULL '
+            parts.append('NOT NULL')
         # auto-incrementing
         try:
             identity = dtnode.identity
         except AttributeError:
             identity = None
         if not identity is None:
-            self.sql_string += 'AUTO_INCREMENT '
-        if self.sql_string[-1] == ' ':
-            self.sql_string = self.sql_string[:-1]
+            parts.append('AUTO_INCREMENT')
         # and that's it folks
-        self.sql_string += ',\n'
+        self.sql_lines.append(' '.join(parts) + ',\n')
 
         # Is this column a foreign key into another table?
         ftable = Driver.get_foreign_key(node)
@@ -330,11 +373,11 @@ class SqlDriver(Driver):
 
     def view_start(self, name, node):
         '''Starting to process view `name`'''
-        self.sql_string += 'CREATE VIEW IF NOT EXISTS `' + name + '` AS\n'
+        self.sql_lines.append('CREATE VIEW IF NOT EXISTS `' + name + '` AS\n')
 
     def view_end(self, name, node):
         '''Done processing view `name`'''
-        self.sql_string += ';\n'
+        self.sql_lines.append(';\n')
 
     def view_subset(self, node, subset):
         '''Process a subset in a view'''
@@ -348,15 +391,415 @@ class SqlDriver(Driver):
 
         if name_in is None:
             # only a primary table
-            self.sql_string += '  SELECT * FROM ' + name1 + ' WHERE ' + \
-                col1 + constraint + value + '\n'
+            self.sql_lines.append(
+                '  SELECT * FROM ' + name1 + ' WHERE ' +
+                col1 + constraint + value + '\n')
         else:
             # a primary and a secondary
-            self.sql_string += '  SELECT * FROM ' + name1 + ' WHERE ' + \
-                col1 + ' IN (\n' + \
-                '    SELECT ' + incol + ' FROM ' + name_in + ' WHERE ' + \
-                where + constraint + value + ')\n'
+            self.sql_lines.append(
+                '  SELECT * FROM ' + name1 + ' WHERE ' +
+                col1 + ' IN (\n' +
+                '    SELECT ' + incol + ' FROM ' + name_in + ' WHERE ' +
+                where + constraint + value + ')\n')
+
+
+# ----------------------------------------------------------------------------
+
+class TableVariables(dict):
+    '''
+    The variable map used for the files of a table or view.
+
+    The variables that are built from the columns are computed the first
+    time a template looks them up (see `VARIABLES`), so the ones that
+    the templates in use never reference cost nothing.
+    '''
+
+    # the variables computed on demand and the methods computing them
+    VARIABLES = {
+        'PIPE_COLUMNS': 'pipe_columns',
+        'CASE_COLUMNS': 'case_columns',
+        'CASE_LABELS': 'case_labels',
+        'MODEL_LABELS': 'model_labels',
+        'BIND_COLUMNS': 'bind_columns',
+        'RETREIVE_COLUMNS': 'retrieve_columns',
+        'RECORD_COLUMNS': 'record_columns',
+        'BIND_ONE_COLUMN': 'bind_one_column',
+        'BATCH_COLUMNS': 'batch_columns',
+        'BATCH_APPEND_COLUMNS': 'batch_append_columns',
+        'BATCH_BIND_COLUMNS': 'batch_bind_columns',
+        'COLUMN_SETTERS': 'column_setters',
+        'SORTED_COLUMN_NAMES': 'sorted_column_names',
+        'CHANGED_COLUMNS': 'changed_columns',
+        'COMMA_COLUMNS': 'comma_columns',
+        'COMMA_COLUMNS_NO_ID': 'comma_columns_no_id',
+        'COLUMN_COLUMNS': 'column_columns',
+        'ASSIGN_COLUMNS': 'assign_columns',
+        'COLUMN_IDS': 'column_ids',
+        'TableColumnConstr': 'column_getters',
+        'TableColumnsIndexCtor': 'column_index_getters',
+        'TableDataMembers': 'table_data_members',
+        'CopyConstructor': 'copy_constr',
+        'AssignConstructor': 'assign_constr',
+        'DefaultConstructor': 'default_constr',
+        'RecToMap': 'rec_to_map',
+        'RecFromMap': 'rec_from_map',
+        'SetTableDefaults': 'set_table_defaults',
+        'RealColumnMapping': 'real_column_mapping',
+        'VirtualColumnMapping': 'virtual_column_mapping',
+    }
+
+    def __init__(self, data, db_name, name, columns):
+        super(TableVariables, self).__init__(data)
+        # one item per column in each list; plain lists of strings are
+        # used (instead of an object per column) as they are not seen
+        # by the garbage collector
+        self.names = list(columns)
+        self.var_names = [col.lower() for col in columns]
+        self.dbc_names = ['COLID_' + col.upper() for col in columns]
+        self.coldata = [columns[col] for col in columns]
+        self.qtypes = [coldata['qtype'] for coldata in self.coldata]
+        self.labels = []
+        self.virtual = [coldata['virtual'] for coldata in self.coldata]
+        # the index in the query (of the next real column if virtual)
+        self.real_ids = []
+        self.fkey_cols = []
+        self.indexes = list(range(len(columns)))
+        self.real_indexes = []
+        self.column_ctors = None # the DbColumn constructor of each column
+
+        id_column = -1
+        real_id = 0
+        for i, col in enumerate(columns):
+            coldata = columns[col]
+            self.labels.append(
+                'QCoreApplication::translate("' + db_name + \
+                '::' + name + '", "' + coldata['label'] + '")')
+            self.real_ids.append(real_id)
+            if not coldata['virtual']:
+                if col == 'id':
+                    id_column = i
+                self.real_indexes.append(i)
+                real_id = real_id + 1
+
+            # definition related to foreign keys
+            fkey_data = coldata['fkey']
+            if fkey_data:
+                fkey_col = '%-40s, %-30s, %-30s, %-15s' % (
+                    'QLatin1String("%s")' % fkey_data[0],
+                    'QLatin1String("%s")' % fkey_data[1],
+                    'QLatin1String("%s")' % fkey_data[2]
+                    if fkey_data[2] else 'QString()',
+                    'DbColumn::FB_CHOOSE'
+                    if fkey_data[3] == '' or fkey_data[3] == 'choose'
+                    else 'DbColumn::FB_CHOOSE_ADD')
+            else:
+                fkey_col = '%-40s, %-30s, %-30s, %-15s' % (
+                    'QString()', 'QString()',
+                    'QString()', 'DbColumn::FB_CHOOSE')
+            self.fkey_cols.append(fkey_col)
+
+        int_types = ['long', 'integer', 'bigint', 'smallint', 'tinyint']
+        if id_column == -1:
+            id_column = 'COLID_INVALID'
+            get_id_result = 'COLID_INVALID'
+            set_id = '// id unavailable in this model'
+        elif columns['id']['datatype'] in int_types:
+            get_id_result = 'id'
+            set_id = 'id = value'
+        else:
+            get_id_result = 'COLID_INVALID'
+            set_id = '// id unavailable in this model'
+
+        self['COLUMN_COUNT'] = str(len(columns))
+        self['ID_COLUMN'] = str(id_column)
+        self['GET_ID_RESULT'] = str(get_id_result)
+        self['SET_ID_RESULT'] = str(set_id)
+        self['SetTableOverrides'] = ''
+
+    def __missing__(self, key):
+        try:
+            method = self.VARIABLES[key]
+        except KeyError:
+            raise KeyError(key)
+        value = getattr(self, method)()
+        self[key] = value
+        return value
+
+    def column_ids(self):
+        '''`COLUMN_IDS`: the enumeration of column ids'''
+        return ''.join(
+            ' ' * 8 + dbc_name + ',\n' for dbc_name in self.dbc_names)
+
+    def real_column_mapping(self):
+        '''
+        `RealColumnMapping`: the index of each column in the query,
+        -1 for virtual ones
+        '''
+        return ''.join(
+            4*' ' + ('/* ' + self.dbc_names[i] + ' -> */ ').ljust(64) +
+            ('-1' if self.virtual[i] else str(self.real_ids[i])) +
+            ',\n' for i in self.indexes)[:-2]
+
+    def virtual_column_mapping(self):
+        '''`VirtualColumnMapping`: the column id of each real column'''
+        return ''.join(
+            4*' ' + ('/* ' + self.dbc_names[i] + ' -> */ ').ljust(64) +
+            str(i) + ',\n' for i in self.real_indexes)[:-2]
+
+    def pipe_columns(self):
+        '''`PIPE_COLUMNS`: the names of all columns streamed into a list'''
+        return ''.join(
+            ' ' * 8 + '<< QLatin1String("' + col + '")\n'
+            for col in self.names)[:-1]
+
+    def default_constr(self):
+        '''`DefaultConstructor`: the initializers of the default constructor'''
+        result = []
+        for i in self.indexes:
+            var_name = self.var_names[i]
+            if self.names[i] != 'id' or self.virtual[i]:
+                result.append(' ' * 8 + var_name + '(),\n')
+            elif self.coldata[i]['autoincrement']:
+                result.append(' ' * 8 + var_name + '(COLID_INVALID),\n')
+            elif self.qtypes[i] == 'QString':
+                result.append(
+                    ' ' * 8 + var_name + '(QLatin1String("-1")),\n')
+            else:
+                result.append(' ' * 8 + var_name + '(),\n')
+        return ''.join(result)[:-2]
+
+    def comma_columns_no_id(self):
+        '''`COMMA_COLUMNS_NO_ID`: the names of the real columns except id'''
+        return ''.join(
+            ' ' * 12 + '"' + self.names[i] + ',"\n'
+            for i in self.real_indexes if self.names[i] != 'id')[:-3] + '"'
+
+    def column_columns(self):
+        '''
+        `COLUMN_COLUMNS`: the placeholders of the real columns except id
+        '''
+        return ''.join(
+            ' ' * 12 + '":' + self.names[i] + ',"\n'
+            for i in self.real_indexes if self.names[i] != 'id')[:-3] + '"'
+
+    def assign_columns(self):
+        '''
+        `ASSIGN_COLUMNS`: the assignments of the real columns except id
+        '''
+        return ''.join(
+            ' ' * 12 + '"' + self.names[i] + '=:' + self.names[i] + ',"\n'
+            for i in self.real_indexes if self.names[i] != 'id')[:-3] + '"'
+
+    def bind_one_column(self):
+        '''`BIND_ONE_COLUMN`: the cases binding one real column'''
+        return ''.join(
+            ' ' * 4 + 'case ' + self.dbc_names[i] +
+            ': query.bindValue (QLatin1String(":' + self.names[i] + '"), ' +
+            self.var_names[i] + '); break;\n'
+            for i in self.real_indexes)[:-1]
+
+    def changed_columns(self):
+        '''
+        `CHANGED_COLUMNS`: the comparisons finding changed real columns
+        '''
+        return ''.join(
+            ' ' * 4 + 'if (other.' + self.var_names[i] +
+            ' != ' + self.var_names[i] + ') result << ' +
+            self.dbc_names[i] + ';\n'
+            for i in self.real_indexes)
+
+    def bind_columns(self):
+        '''`BIND_COLUMNS`: the statements binding all real columns'''
+        return ''.join(
+            ' ' * 4 + 'query.bindValue (QLatin1String(":' +
+            self.names[i] + '"), ' + self.var_names[i] + ');\n'
+            for i in self.real_indexes)[:-1]
+
+    def batch_columns(self):
+        '''`BATCH_COLUMNS`: the declarations of a value list per real column'''
+        return ''.join(
+            ' ' * 4 + 'QVariantList v_' + self.var_names[i] + ';\n'
+            for i in self.real_indexes)[:-1]
+
+    def batch_append_columns(self):
+        '''`BATCH_APPEND_COLUMNS`: the values of a record added to the lists'''
+        return ''.join(
+            ' ' * 8 + 'v_' + self.var_names[i] + '.append (record.' +
+            self.var_names[i] + ');\n'
+            for i in self.real_indexes)[:-1]
+
+    def batch_bind_columns(self):
+        '''
+        `BATCH_BIND_COLUMNS`: the statements binding the lists; inserts
+        and updates both use the id
+        '''
+        return ''.join(
+            ' ' * 8 + 'query->bindValue (QLatin1String(":' + self.names[i] +
+            '"), v_' + self.var_names[i] + ');\n'
+            for i in self.real_indexes)[:-1]
 
+    def column_setters(self):
+        '''
+        `COLUMN_SETTERS`: the setters that also mark the columns as changed;
+        the id has none as it is set through `setId()` and virtual columns
+        have none as they are not saved
+        '''
+        return ''.join(
+            '    //! Set the %s column and mark it as changed.\n'
+            '    void set%s (const %s & value) { %s = value; setDirty (%s); }\n'
+            % (self.names[i], self.var_names[i][:1].upper() +
+               self.var_names[i][1:], self.qtypes[i], self.var_names[i],
+               self.dbc_names[i])
+            for i in self.indexes
+            if self.names[i] != 'id' and not self.virtual[i])[:-1]
+
+    def sorted_column_names(self):
+        '''
+        `SORTED_COLUMN_NAMES`: the name and id of each column, sorted by
+        lowercase name for `DbObject::findName()`
+        '''
+        return ''.join(
+            '        { "%s", %s },\n' % (self.names[i], self.dbc_names[i])
+            for i in sorted(
+                self.indexes, key=lambda i: (self.var_names[i], i)))[:-1]
+
+    def comma_columns(self):
+        '''`COMMA_COLUMNS`: the names of all real columns'''
+        return ''.join(
+            ' ' * 12 + '"' + self.names[i] + ',"\n'
+            for i in self.real_indexes)[:-3] + '"'
+
+    def retrieve_columns(self):
+        '''`RETREIVE_COLUMNS`: the members read from a query'''
+        return ''.join(
+            '    %-26s = %10squery.value (/* %33s */ %4d).%s;\n' % (
+                self.var_names[i], TO_CAST[self.qtypes[i]],
+                self.dbc_names[i], self.real_ids[i],
+                FROM_VARIANT[self.qtypes[i]])
+            for i in self.real_indexes)
+
+    def record_columns(self):
+        '''`RECORD_COLUMNS`: the members read from a QSqlRecord'''
+        return ''.join(
+            '    %-20s = %10srec.value (%40s).%s;\n' % (
+                self.var_names[i], TO_CAST[self.qtypes[i]],
+                'QLatin1String("%s")' % self.names[i],
+                FROM_VARIANT[self.qtypes[i]])
+            for i in self.real_indexes)
+
+    def assign_constr(self):
+        '''`AssignConstructor`: the body of the assignment operator'''
+        return ''.join(
+            ' ' * 8 + var_name + ' = other.' + var_name + ';\n'
+            for var_name in self.var_names)[:-1]
+
+    def copy_constr(self):
+        '''`CopyConstructor`: the initializers of the copy constructor'''
+        return ''.join(
+            ' ' * 8 + var_name + ' (other.' + var_name + '),\n'
+            for var_name in self.var_names)[:-2]
+
+    def table_data_members(self):
+        '''`TableDataMembers`: the declarations of the members'''
+        return ''.join(
+            ' ' * 4 + self.qtypes[i] + ' ' + self.var_names[i] + ';\n'
+            for i in self.indexes)
+
+    def case_labels(self):
+        '''`CASE_LABELS`: the cases returning the label of a column'''
+        return ''.join(
+            ' ' * 4 + 'case ' + self.dbc_names[i] + ': result = ' +
+            self.labels[i] + '; break;\n'
+            for i in self.indexes)
+
+    def case_columns(self):
+        '''`CASE_COLUMNS`: the cases returning the name of a column'''
+        return ''.join(
+            ' ' * 4 + 'case ' + self.dbc_names[i] +
+            ': result = QLatin1String("' + self.names[i] + '"); break;\n'
+            for i in self.indexes)[:-1]
+
+    def model_labels(self):
+        '''`MODEL_LABELS`: the header labels set in a model'''
+        return ''.join(
+            ' ' * 4 + 'model->setHeaderData (' + self.dbc_names[i] +
+            ', Qt::Horizontal, ' + self.labels[i] + ');\n'
+            for i in self.indexes)
+
+    def get_column_ctors(self):
+        '''The DbColumn constructor of each column'''
+        if self.column_ctors is None:
+            self.column_ctors = []
+            for i in self.indexes:
+                coldata = self.coldata[i]
+                # the other column for virtual columns
+                try:
+                    virt_ref_col = 'COLID_' + coldata['reference'].upper()
+                except (KeyError, AttributeError):
+                    virt_ref_col = -1
+
+                self.column_ctors.append(
+                    'DbColumn (%-40s,%-25s,%-6d,%-6d,%-80s,%-30s,%-7s,%-7s,' \
+                    '%-25s,%-40s,%-7s,%-16s,%s)' % (
+                        'QLatin1String("%s")' % self.names[i],
+                        self.dbc_names[i],
+                        self.real_ids[i],
+                        int(coldata['length']) if coldata['length'] else -1,
+                        self.labels[i],
+                        'DbColumn::DTY_%s' % coldata['datatype'].upper(),
+                        'true' if coldata['nulls'] else 'false',
+                        'true' if coldata['autoincrement'] else 'false',
+                        'QLatin1String("%s")' % coldata['defexpr']
+                        if coldata['defexpr'] else 'QString()',
+                        'QLatin1String("%s")' % coldata['format']
+                        if coldata['format'] else 'QString()',
+                        'true' if coldata['ronly'] else 'false',
+                        virt_ref_col,
+                        self.fkey_cols[i]
+                    ))
+        return self.column_ctors
+
+    def column_getters(self):
+        '''`TableColumnConstr`: the static DbColumn constructors'''
+        return ''.join(
+            '    static DbColumn %30sColCtor () { return %s; }\n' % (
+                var_name, column_create)
+            for var_name, column_create in zip(
+                self.var_names, self.get_column_ctors()))
+
+    def column_index_getters(self):
+        '''`TableColumnsIndexCtor`: the cases returning a DbColumn by id'''
+        return ''.join(
+            '    case %20s: return %s;\n' % (dbc_name, column_create)
+            for dbc_name, column_create in zip(
+                self.dbc_names, self.get_column_ctors()))
+
+    def rec_to_map(self):
+        '''`RecToMap`: the members inserted in a QVariantMap'''
+        return ''.join(
+            '    result.insert(%-40s, %-30s);\n' % (
+                'QLatin1String ("%s")' % self.names[i],
+                ('qVariantFromValue (%s)' % self.var_names[i])
+                if self.coldata[i]['dynamic']
+                else 'QVariant (%s)' % self.var_names[i])
+            for i in self.indexes)
+
+    def rec_from_map(self):
+        '''`RecFromMap`: the members read from a QVariantMap'''
+        return ''.join(
+            '        if (!i.key ().compare (%40s)) { '
+            '%-20s = i.value ().%s; }\n' % (
+                'QLatin1String ("%s")' % self.names[i],
+                self.var_names[i],
+                FROM_VARIANT[self.qtypes[i]])
+            for i in self.indexes)
+
+    def set_table_defaults(self):
+        '''`SetTableDefaults`: the members set to their default values'''
+        return ''.join(
+            make_value_setter(
+                self.var_names[i], self.coldata[i]['defval'], self.qtypes[i])
+            for i in self.indexes if self.coldata[i]['defval'])
 
 # ----------------------------------------------------------------------------
 
@@ -367,7 +810,9 @@ class QtDriver(Driver):
     def __init__(self, out_dir, template_dir,
                  namespace='', export_macro='',
                  import_header='',
-                 base_class=META_TABLE_BASE):
+                 base_class=META_TABLE_BASE, jobs=1, cache_dir=None,
+                 unity_chunks=0):
+        super(QtDriver, self).__init__()
 
         self.out_dir = out_dir
         self.template_dir = template_dir
@@ -378,124 +823,279 @@ class QtDriver(Driver):
         self.namespace = namespace
         self.export_macro = export_macro
         self.base_class = base_class
-        self.tables = OrderedDict()
-        self.views = OrderedDict()
+        self.cache_dir = cache_dir # where compiled templates are kept
+        self.unity_chunks = unity_chunks # number of unity build sources
         self.columns = OrderedDict()
         self.vrtcols = [] # the names of the columns that are virtual
-        super(QtDriver, self).__init__()
+        self.written = 0 # number of files that were saved
+        self.skipped = 0 # number of files that were already up to date
+        self.manifest = load_manifest(out_dir) # fingerprints of last run
+        self.new_manifest = {} # fingerprints of this run
+        self.outputs = [] # all files generated by this run
+        self.templates_digest = None
+        self.reuse_view = False # the output of current view is up to date
+        self.view_source = None # the table and writeback of current view
+        self.jobs = jobs # number of processes that generate files
+        self.pool = None
+        self.pending = [] # the results expected from self.pool
+        # what a worker process needs to create an equivalent driver
+        self.options = {
+            'out_dir': out_dir,
+            'template_dir': template_dir,
+            'namespace': namespace,
+            'export_macro': export_macro,
+            'import_header': import_header,
+            'base_class': base_class,
+            'cache_dir': cache_dir,
+        }
 
     def database_start(self, name, node):
         '''Starting to process database `name`'''
         self.db_name = name
 
+    def write_output(self, fname, content):
+        '''Saves a generated file unless it already has that content'''
+        if write_if_changed(fname, content):
+            self.written += 1
+        else:
+            self.skipped += 1
+
+    def fingerprint(self, *parts):
+        '''A digest of `parts` and of the content of the templates'''
+        if self.templates_digest is None:
+            digest = hashlib.sha1()
+            for fname in sorted(glob.glob(
+                    os.path.join(self.template_dir, '*.template'))):
+                digest.update(os.path.basename(fname))
+                digest.update(
+                    self.get_template(os.path.basename(fname)).digest)
+            self.templates_digest = digest.digest()
+        digest = hashlib.sha1(self.templates_digest)
+        digest.update(repr(parts))
+        return digest.hexdigest()
+
+    def is_current(self, component, fingerprint, fnames):
+        '''
+        Records the fingerprint of the inputs of a component (a table,
+        a view or the database) and tells if the files generated for it
+        by a previous run with the same fingerprint can be kept.
+        '''
+        self.new_manifest[component] = fingerprint
+        self.outputs.extend(fnames)
+        if self.manifest.get(component) != fingerprint:
+            return False
+        for fname in fnames:
+            if not os.path.isfile(fname):
+                return False
+        self.skipped += len(fnames)
+        return True
+
     def database_end(self, name, node):
         '''Done processing database `name.`'''
 
+        self.wait_for_workers()
         self.check_foreign_keys()
 
-        all_hdr = ''
-        all_meta_hdr = ''
-        db_comp_id = ''
-        db_table_id = ''
-        db_tables_constr = ''
-        db_comp_name_case = ''
-        db_table_name_case = ''
-        db_name_to_id = ''
-        db_new_components = ''
+        all_hdr = []
+        all_meta_hdr = []
+        db_comp_id = []
+        db_table_id = []
+        db_tables_constr = []
+        db_comp_name_case = []
+        db_table_name_case = []
+        db_name_to_id = []
+        db_new_components = []
         nspace_prefix = self.db_name.lower() + '::meta::'
         for tbl in self.tables:
             with_nspace = nspace_prefix + tbl
             dbc_name = 'DBC_' + tbl.upper()
             dbt_name = 'DBT_' + tbl.upper()
-            all_hdr += '#include "' + tbl.lower() + '.h"\n'
-            all_meta_hdr += '#include "' + tbl.lower() + '-meta.h"\n'
-            db_comp_id += ' ' * 8 + dbc_name + ',\n'
-            db_table_id += ' ' * 8 + dbt_name + ',\n'
-            db_tables_constr += '    static ' + with_nspace + ' ' + \
-                tbl.lower() + ' () { return ' + with_nspace + '(); }\n'
-            db_comp_name_case += ' ' * 8 + 'case ' + dbc_name + \
-                ': return QLatin1String("' + tbl + '");\n'
-            db_table_name_case += ' ' * 8 + 'case ' + dbt_name + \
-                ': return QLatin1String("' + tbl + '");\n'
-            db_name_to_id += ' ' * 8 + 'if (!value.compare(QLatin1String("' + \
-                tbl + '"), Qt::CaseInsensitive)) return ' + dbc_name + ';\n'
-            db_new_components += ' ' * 8 + 'case ' + dbc_name + \
-                ': return new ' + with_nspace + '();\n'
-
-
-        db_view_id = ''
-        db_views_constr = ''
-        db_view_name_case = ''
+            all_hdr.append('#include "' + tbl.lower() + '.h"\n')
+            all_meta_hdr.append('#include "' + tbl.lower() + '-meta.h"\n')
+            db_comp_id.append(' ' * 8 + dbc_name + ',\n')
+            db_table_id.append(' ' * 8 + dbt_name + ',\n')
+            db_tables_constr.append('    static ' + with_nspace + ' ' +
+                tbl.lower() + ' () { return ' + with_nspace + '(); }\n')
+            db_comp_name_case.append(' ' * 8 + 'case ' + dbc_name +
+                ': return QLatin1String("' + tbl + '");\n')
+            db_table_name_case.append(' ' * 8 + 'case ' + dbt_name +
+                ': return QLatin1String("' + tbl + '");\n')
+            db_name_to_id.append(
+                ' ' * 8 + 'if (!value.compare(QLatin1String("' + tbl +
+                '"), Qt::CaseInsensitive)) return ' + dbc_name + ';\n')
+            db_new_components.append(' ' * 8 + 'case ' + dbc_name +
+                ': return new ' + with_nspace + '();\n')
+
+
+        db_view_id = []
+        db_views_constr = []
+        db_view_name_case = []
         for view in self.views:
             with_nspace = nspace_prefix + view
             dbc_name = 'DBC_' + view.upper()
             dbv_name = 'DBV_' + view.upper()
-            db_comp_id += ' ' * 8 + dbc_name + ',\n'
-            db_view_id += ' ' * 8 + dbv_name + ',\n'
-            db_views_constr += '    static ' + with_nspace + ' ' + \
-                view.lower() + ' () { return ' + with_nspace + \
-                '(); }\n'
-            db_comp_name_case += ' ' * 8 + 'case ' + dbc_name + \
-                ': return QLatin1String("' + view + '");\n'
-            db_view_name_case += ' ' * 8 + 'case ' + dbv_name + \
-                ': return QLatin1String("' + view + '");\n'
-            db_name_to_id += ' ' * 8 + 'if (!value.compare(QLatin1String("' + \
-                view + '"), Qt::CaseInsensitive)) return ' + dbc_name + ';\n'
-            all_hdr += '#include "' + view.lower() + '.h"\n'
-            all_meta_hdr += '#include "' + view.lower() + '-meta.h"\n'
-            db_new_components += ' ' * 8 + 'case ' + dbc_name + \
-                ': return new ' + with_nspace + '();\n'
+            db_comp_id.append(' ' * 8 + dbc_name + ',\n')
+            db_view_id.append(' ' * 8 + dbv_name + ',\n')
+            db_views_constr.append('    static ' + with_nspace + ' ' +
+                view.lower() + ' () { return ' + with_nspace +
+                '(); }\n')
+            db_comp_name_case.append(' ' * 8 + 'case ' + dbc_name +
+                ': return QLatin1String("' + view + '");\n')
+            db_view_name_case.append(' ' * 8 + 'case ' + dbv_name +
+                ': return QLatin1String("' + view + '");\n')
+            db_name_to_id.append(
+                ' ' * 8 + 'if (!value.compare(QLatin1String("' + view +
+                '"), Qt::CaseInsensitive)) return ' + dbc_name + ';\n')
+            all_hdr.append('#include "' + view.lower() + '.h"\n')
+            all_meta_hdr.append('#include "' + view.lower() + '-meta.h"\n')
+            db_new_components.append(' ' * 8 + 'case ' + dbc_name +
+                ': return new ' + with_nspace + '();\n')
 
         self.data['BaseClass'] = 'DbStructMeta'
         self.data['baseclass'] = 'dbstructmeta'
         self.data['BASECLASS'] = 'DBSTRUCTMETA'
-        self.data['INCLUDE_ALL_HEADERS'] = all_hdr
-        self.data['INCLUDE_ALL_META_HEADERS'] = all_meta_hdr
-        self.data['DBC_IDS'] = db_comp_id
-        self.data['DB_TABLE_IDS'] = db_table_id
-        self.data['DB_VIEW_IDS'] = db_view_id
-        self.data['DB_TABLES_CONSTR'] = db_tables_constr
-        self.data['DB_VIEWS_CONSTR'] = db_views_constr
-        self.data['DB_COMPONENTS_NAME_CASE'] = db_comp_name_case
-        self.data['DB_TABLES_NAME_CASE'] = db_table_name_case
-        self.data['DB_VIEWS_NAME_CASE'] = db_view_name_case
-        self.data['DB_COMPONENTS_NAME_TO_ID'] = db_name_to_id
+        self.data['INCLUDE_ALL_HEADERS'] = ''.join(all_hdr)
+        self.data['INCLUDE_ALL_META_HEADERS'] = ''.join(all_meta_hdr)
+        self.data['DBC_IDS'] = ''.join(db_comp_id)
+        self.data['DB_TABLE_IDS'] = ''.join(db_table_id)
+        self.data['DB_VIEW_IDS'] = ''.join(db_view_id)
+        self.data['DB_TABLES_CONSTR'] = ''.join(db_tables_constr)
+        self.data['DB_VIEWS_CONSTR'] = ''.join(db_views_constr)
+        self.data['DB_COMPONENTS_NAME_CASE'] = ''.join(db_comp_name_case)
+        self.data['DB_TABLES_NAME_CASE'] = ''.join(db_table_name_case)
+        self.data['DB_VIEWS_NAME_CASE'] = ''.join(db_view_name_case)
+        self.data['DB_COMPONENTS_NAME_TO_ID'] = ''.join(db_name_to_id)
+        self.data['DB_SORTED_COMPONENT_NAMES'] = ''.join(
+            ' ' * 8 + '{ "' + comp + '", DBC_' + comp.upper() + ' },\n'
+            for comp in sorted(
+                list(self.tables) + list(self.views),
+                key=lambda comp: comp.lower()))
+        db_new_components = ''.join(db_new_components)
         self.data['DB_NEW_COMPONENTS'] = db_new_components
         self.data['DB_CHANGED_COMPONENTS'] = db_new_components
 
+        # only the components and common data reach the database files
+        fingerprint = self.fingerprint(
+            list(self.tables), list(self.views),
+            sorted(self.common_data().items()), self.unity_chunks)
+        fnames = [
+            os.path.join(self.out_dir, self.data['database'] + '.h'),
+            os.path.join(self.out_dir, self.data['database'] + '.cc'),
+            os.path.join(self.out_dir, 'all-meta-tables.h'),
+            os.path.join(self.out_dir, 'all-tables.h'),
+        ]
+        if self.unity_chunks > 0:
+            fnames.extend(
+                os.path.join(self.out_dir, fname)
+                for fname in self.unity_sources())
+            fnames.append(os.path.join(
+                self.out_dir, self.data['database'] + '-sources.cmake'))
+        if self.is_current('database', fingerprint, fnames):
+            self.finish_database()
+            return
+
         fname = os.path.join(self.out_dir, self.data['database'] + '.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('database.h.template') % self.data)
+        self.write_output(
+            fname, self.get_template('database.h.template') % self.data)
 
         fname = os.path.join(self.out_dir, self.data['database'] + '.cc')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('database.cc.template') % self.data)
+        self.write_output(
+            fname, self.get_template('database.cc.template') % self.data)
 
         fname = os.path.join(self.out_dir, 'all-meta-tables.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp,
-                self.get_template('all-meta-tables.h.template') % self.data)
+        self.write_output(
+            fname, self.get_template('all-meta-tables.h.template') % self.data)
 
         fname = os.path.join(self.out_dir, 'all-tables.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('all-tables.h.template') % self.data)
+        self.write_output(
+            fname, self.get_template('all-tables.h.template') % self.data)
 
+        if self.unity_chunks > 0:
+            self.write_unity_build()
+
+        self.finish_database()
+
+    def generated_files(self):
+        '''
+        The headers and the sources generated for the database, in the
+        order of the tables and views.
+        '''
+        headers = [
+            self.data['database'] + '.h', 'all-meta-tables.h', 'all-tables.h']
+        sources = [self.data['database'] + '.cc']
+        for component in list(self.tables) + list(self.views):
+            headers.append(component.lower() + '.h')
+            headers.append(component.lower() + '-meta.h')
+            sources.append(component.lower() + '.cc')
+            sources.append(component.lower() + '-meta.cc')
+        return headers, sources
+
+    def unity_sources(self):
+        '''
+        The unity build sources and the generated sources each of them
+        includes; consecutive sources are kept together and the sizes of
+        the chunks differ by one at most.
+        '''
+        sources = self.generated_files()[1]
+        chunks = min(self.unity_chunks, len(sources))
+        result = OrderedDict()
+        for index in range(chunks):
+            fname = '%s-unity-%d.cc' % (self.data['database'], index + 1)
+            result[fname] = sources[len(sources) * index // chunks:
+                                    len(sources) * (index + 1) // chunks]
+        return result
+
+    def write_unity_build(self):
+        '''
+        Writes the unity build sources and a CMake file that lists them,
+        together with the generated headers.
+        '''
+        headers = self.generated_files()[0]
+        unity_sources = self.unity_sources()
+        # left by a run with more chunks
+        for fname in glob.glob(os.path.join(
+                self.out_dir, self.data['database'] + '-unity-*.cc')):
+            if os.path.basename(fname) not in unity_sources:
+                os.remove(fname)
+        for fname in unity_sources:
+            self.write_output(
+                os.path.join(self.out_dir, fname),
+                '// Unity build source for the %s database; '
+                'generated by pileschema.py.\n'
+                '// Compile this file instead of the sources it includes.\n'
+                '\n%s' % (self.db_name, ''.join(
+                    '#include "%s"\n' % source
+                    for source in unity_sources[fname])))
+
+        var_prefix = self.data['DATABASE']
+        fname = os.path.join(
+            self.out_dir, self.data['database'] + '-sources.cmake')
+        self.write_output(
+            fname,
+            '# Files generated by pileschema.py for the %s database.\n'
+            '# The sources are the unity build sources; the generated .cc\n'
+            '# files are compiled through them.\n'
+            '\nset(%s_HEADERS\n%s)\n'
+            '\nset(%s_SOURCES\n%s)\n' % (
+                self.db_name,
+                var_prefix, ''.join(
+                    '    "${CMAKE_CURRENT_LIST_DIR}/%s"\n' % fname
+                    for fname in headers),
+                var_prefix, ''.join(
+                    '    "${CMAKE_CURRENT_LIST_DIR}/%s"\n' % fname
+                    for fname in unity_sources)))
+
+    def finish_database(self):
+        '''Saves the manifest once all files were generated'''
+        save_manifest(self.out_dir, self.new_manifest)
         self.db_name = ''
 
-    def bootstrap_data(self, name):
-        '''Add common data in the variable map'''
-        now = datetime.datetime.now()
-        self.data = {
+    def common_data(self):
+        '''The part of the variable map that is the same for all files'''
+        return {
             'Database': self.db_name,
             'database': self.db_name.lower(),
             'DATABASE': self.db_name.upper(),
-            'Table': name,
-            'table': name.lower(),
-            'TABLE': name.upper(),
             'Namespace': self.namespace,
             'namespace': self.namespace.lower(),
             'NAMESPACE': self.namespace.upper(),
@@ -506,11 +1106,18 @@ class QtDriver(Driver):
             'RecordBaseClass': RECORD_BASE,
             'EXPORT': self.export_macro,
             'IMPORTH': '#include <%s>' % self.import_header,
-            'Year': str(now.year),
-            'Month': now.strftime("%B"),
+            'Year': str(BUILD_DATE.year) if BUILD_DATE else '',
+            'Month': BUILD_DATE.strftime("%B") if BUILD_DATE else '',
             'Author': AUTHOR
         }
 
+    def bootstrap_data(self, name):
+        '''Add common data in the variable map'''
+        self.data = self.common_data()
+        self.data['Table'] = name
+        self.data['table'] = name.lower()
+        self.data['TABLE'] = name.upper()
+
     def table_start(self, name, node):
         '''Starting to process table `name`'''
         self.tables[name] = {}
@@ -519,264 +1126,13 @@ class QtDriver(Driver):
         self.vrtcols = []
 
     def fill_table_data(self, name):
-        '''Prepare values for variables in the context of this table'''
-
-        id_column = -1
-        pipe_columns = ''
-        case_columns = ''
-        case_label = ''
-        model_label = ''
-        bind_columns = ''
-        bind_one_column = ''
-        changed_column = ''
-        comma_columns = ''
-        column_columns = ''
-        assign_columns = ''
-        comma_columns_no_id = ''
-        retrieve_columns = ''
-        record_columns = ''
-        rec_to_map = ''
-        rec_from_map = ''
-        column_getters = ''
-        column_index_getters = ''
-        table_data_members = ''
-        default_constr = ''
-        assign_constr = ''
-        copy_constr = ''
-        real_column_mapping = ''
-        virtual_column_mapping = ''
-        set_table_defaults = ''
-        i = -1
-        real_id = 0
-
-        column_ids = ''
-        for i, col in enumerate(self.columns):
-            coldata = self.columns[col]
-            col_var_name = col.lower()
-            qtype = coldata['qtype']
-            defval = coldata['defval']
-            dynamic = coldata['dynamic']
-            to_cast = TO_CAST[qtype]
-            to_converter = FROM_VARIANT[qtype]
-            dbc_name = 'COLID_' + col.upper()
-            column_ids += ' ' * 8 + dbc_name + ',\n'
-            column_label = 'QCoreApplication::translate("' + self.db_name + \
-                '::' + name + '", "' + coldata['label'] + '")'
-
-            col_mapping_nicety = '/* ' + dbc_name + ' -> */ '
-            col_mapping_nicety += ' ' * (64 - len(col_mapping_nicety))
-            real_column_mapping += 4*' ' + col_mapping_nicety
-            pipe_columns += ' ' * 8 + '<< QLatin1String("' + col + '")\n'
-            if not coldata['virtual']:
-                real_column_mapping += str(real_id) + ',\n'
-                virtual_column_mapping += 4*' ' + col_mapping_nicety + str(i) + ',\n'
-                if col == 'id':
-                    id_column = i
-                    if coldata['autoincrement']:
-                        default_constr = default_constr + ' ' * 8 + col_var_name + \
-                            '(COLID_INVALID),\n'
-                    elif qtype == 'QString':
-                        default_constr = default_constr + ' ' * 8 + col_var_name + \
-                            '(QLatin1String("-1")),\n'
-                    else:
-                        default_constr = default_constr + ' ' * 8 + col_var_name + \
-                            '(),\n'
-                else:
-                    default_constr = default_constr + ' ' * 8 + \
-                        col_var_name + '(),\n'
-                    comma_columns_no_id += ' ' * 12 + '"' + col + ',"\n'
-                    column_columns += ' ' * 12 + '":' + col + ',"\n'
-                    assign_columns += ' ' * 12 + '"' + col + '=:' + col + ',"\n'
-                bind_one_column += ' ' * 4 + 'case ' + dbc_name + \
-                    ': query.bindValue (QLatin1String(":' + col + '"), ' + \
-                    col_var_name + '); break;\n'
-                changed_column += ' ' * 4 + 'if (other.' + col_var_name + \
-                    ' != ' + col_var_name + ') result << ' +\
-                    dbc_name + ';\n'
-                bind_columns += ' ' * 4 + 'query.bindValue (QLatin1String(":' + \
-                    col + '"), ' + col_var_name + ');\n'
-                comma_columns += ' ' * 12 + '"' + col + ',"\n'
-
-                retrieve_columns += \
-                    '    %-26s = %10squery.value (/* %33s */ %4d).%s;\n' % (
-                        col_var_name, to_cast, dbc_name, real_id, to_converter)
-                record_columns += \
-                    '    %-20s = %10srec.value (%40s).%s;\n' % (
-                        col_var_name, to_cast,
-                        'QLatin1String("%s")' % col,
-                        to_converter)
-            else: # is virtual
-                real_column_mapping += '-1,\n'
-                default_constr = default_constr + ' ' * 8 + \
-                    col_var_name + '(),\n'
-
-            assign_constr = assign_constr + ' ' * 8 + col_var_name + \
-                ' = other.' + col_var_name + ';\n'
-            copy_constr = copy_constr + ' ' * 8 + col_var_name + \
-                ' (other.' + col_var_name + '),\n'
-
-            table_data_members += ' ' * 4 + qtype + ' ' + col.lower() + ';\n'
-            case_label += ' ' * 4 + 'case ' + dbc_name + ': result = ' + \
-                column_label + '; break;\n'
-            case_columns += ' ' * 4 + 'case ' + dbc_name + \
-                ': result = QLatin1String("' + col + '"); break;\n'
-            model_label += ' ' * 4 + 'model->setHeaderData (' + dbc_name + \
-                ', Qt::Horizontal, ' + column_label + ');\n'
-
-
-            # definition related to foreign keys
-            fkey_data = coldata['fkey']
-            if fkey_data:
-                if 'foreignInsert' in coldata:
-                    fkey_data[2] = coldata['foreignInsert']
-                fkey_col = '%-40s, %-30s, %-30s, %-15s' % (
-                    'QLatin1String("%s")' % fkey_data[0],
-                    'QLatin1String("%s")' % fkey_data[1],
-                    'QLatin1String("%s")' % fkey_data[2]
-                    if fkey_data[2] else 'QString()',
-                    'DbColumn::FB_CHOOSE'
-                    if fkey_data[3] == '' or fkey_data[3] == 'choose'
-                    else 'DbColumn::FB_CHOOSE_ADD')
-
-#                fkey_col = 'QLatin1String("' + fkey_data[0] + \
-#                    '"), QLatin1String("' + fkey_data[1] + '"), '
-#                if fkey_data[2]:
-#                    fkey_col += 'QLatin1String("' + fkey_data[2] + '")'
-#                else:
-#                    fkey_col += 'QString()'
-#                if fkey_data[3] == '' or fkey_data[3] == 'choose':
-#                    fkey_col += ', DbColumn::FB_CHOOSE'
-#                else:
-#                    fkey_col += ', DbColumn::FB_CHOOSE_ADD'
-            else:
-                fkey_col = '%-40s, %-30s, %-30s, %-15s' % (
-                    'QString()', 'QString()',
-                    'QString()', 'DbColumn::FB_CHOOSE')
-
-            # the other column for virtual columns
-            try:
-                virt_ref_col = 'COLID_' + coldata['reference'].upper()
-            except (KeyError, AttributeError):
-                virt_ref_col = -1
-
-
-            # constructor for column
-            column_create = 'DbColumn (%-40s,%-25s,%-6d,%-6d,%-80s,%-30s,%-7s,%-7s,' \
-                '%-25s,%-40s,%-7s,%-16s,%s)' % (
-                    'QLatin1String("%s")' % col,
-                    dbc_name,
-                    real_id,
-                    int(coldata['length']) if coldata['length'] else -1,
-                    column_label,
-                    'DbColumn::DTY_%s' % coldata['datatype'].upper(),
-                    'true' if coldata['nulls'] else 'false',
-                    'true' if coldata['autoincrement'] else 'false',
-                    'QLatin1String("%s")' % coldata['defexpr']
-                    if coldata['defexpr'] else 'QString()',
-                    'QLatin1String("%s")' % coldata['format']
-                    if coldata['format'] else 'QString()',
-                    'true' if coldata['ronly'] else 'false',
-                    virt_ref_col,
-                    fkey_col
-                )
-#            column_create = 'DbColumn("' + \
-#                col + '", ' + \
-#                dbc_name + ', '+ \
-#                str(real_id) + ', '+ \
-#                string_choice(coldata['length'], '-1', coldata['length']) + \
-#                ', ' + column_label + ', '  + \
-#                'DbColumn::DTY_' + coldata['datatype'].upper() + ', ' + \
-#                string_choice('true', 'false', coldata['nulls']) + ', ' + \
-#                string_choice('true', 'false', coldata['autoincrement']) + \
-#                ', QLatin1String("' + string_choice('', coldata['defexpr'],
-#                    coldata['defexpr'] is None) + '")' + \
-#                ', QLatin1String("' + string_choice('', coldata['format'],
-#                    coldata['format'] is None) + '"), ' + \
-#                string_choice('true', 'false', coldata['ronly']) + ', ' + \
-#                string_choice(virt_ref_col, '-1', coldata['virtual']) + \
-#                ', ' + fkey_col + ')'
-
-
-            column_getters += \
-                '    static DbColumn %30sColCtor () { return %s; }\n' % (
-                    col.lower(), column_create)
-            column_index_getters += \
-                '    case %20s: return %s;\n' % (dbc_name, column_create)
-            rec_to_map += \
-                '    result.insert(%-40s, %-30s);\n' % (
-                    'QLatin1String ("%s")' % col,
-                    ('qVariantFromValue (%s)' % col_var_name)
-                    if dynamic else 'QVariant (%s)' % col_var_name)
-
-            rec_from_map += \
-                '        if (!i.key ().compare (%40s)) { ' \
-                '%-20s = i.value ().%s; }\n' % (
-                    'QLatin1String ("%s")' % col,
-                    col_var_name,
-                    to_converter)
-
-            if defval:
-                set_table_defaults += make_value_setter(
-                    col_var_name, defval, qtype)
-
-            real_id = real_id + (not coldata['virtual'])
-
-        int_types = ['long', 'integer', 'bigint', 'smallint', 'tinyint']
-        if id_column == -1:
-            id_column = 'COLID_INVALID'
-            get_id_result = 'COLID_INVALID'
-            set_id = '// id unavailable in this model'
-        elif self.columns['id']['datatype'] in int_types:
-            get_id_result = 'id'
-            set_id = 'id = value'
-        else:
-            get_id_result = 'COLID_INVALID'
-            set_id = '// id unavailable in this model'
-
-        default_constr = default_constr[:-2]
-        copy_constr = copy_constr[:-2]
-        assign_constr = assign_constr[:-1]
-        pipe_columns = pipe_columns[:-1]
-        case_columns = case_columns[:-1]
-        bind_columns = bind_columns[:-1]
-        bind_one_column = bind_one_column[:-1]
-        comma_columns = comma_columns[:-3] + '"'
-        comma_columns_no_id = comma_columns_no_id[:-3] + '"'
-        column_columns = column_columns[:-3] + '"'
-        assign_columns = assign_columns[:-3] + '"'
-        real_column_mapping = real_column_mapping[:-2]
-        virtual_column_mapping = virtual_column_mapping[:-2]
-
-        self.data['COLUMN_COUNT'] = str(len(self.columns))
-        self.data['PIPE_COLUMNS'] = pipe_columns
-        self.data['CASE_COLUMNS'] = case_columns
-        self.data['CASE_LABELS'] = case_label
-        self.data['MODEL_LABELS'] = model_label
-        self.data['BIND_COLUMNS'] = bind_columns
-        self.data['RETREIVE_COLUMNS'] = retrieve_columns
-        self.data['RECORD_COLUMNS'] = record_columns
-        self.data['BIND_ONE_COLUMN'] = bind_one_column
-        self.data['CHANGED_COLUMNS'] = changed_column
-        self.data['ID_COLUMN'] = str(id_column)
-        self.data['GET_ID_RESULT'] = str(get_id_result)
-        self.data['SET_ID_RESULT'] = str(set_id)
-        self.data['COMMA_COLUMNS'] = comma_columns
-        self.data['COMMA_COLUMNS_NO_ID'] = comma_columns_no_id
-        self.data['COLUMN_COLUMNS'] = column_columns
-        self.data['ASSIGN_COLUMNS'] = assign_columns
-        self.data['COLUMN_IDS'] = column_ids
-        self.data['TableColumnConstr'] = column_getters
-        self.data['TableColumnsIndexCtor'] = column_index_getters
-        self.data['TableDataMembers'] = table_data_members
-        self.data['CopyConstructor'] = copy_constr
-        self.data['AssignConstructor'] = assign_constr
-        self.data['DefaultConstructor'] = default_constr
-        self.data['RecToMap'] = rec_to_map
-        self.data['RecFromMap'] = rec_from_map
-        self.data['SetTableDefaults'] = set_table_defaults
-        self.data['SetTableOverrides'] = ''
-        self.data['RealColumnMapping'] = real_column_mapping
-        self.data['VirtualColumnMapping'] = virtual_column_mapping
+        '''
+        Prepare values for variables in the context of this table; the
+        ones that depend on each column are computed when a template
+        uses them (see `TableVariables`).
+        '''
+        self.data = TableVariables(
+            self.data, self.db_name, name, self.columns)
 
     def table_end(self, name, node):
         '''Done processing table `name`'''
@@ -789,6 +1145,13 @@ class QtDriver(Driver):
                 for okey in coldata:
                     if not okey in vrtdata:
                         vrtdata[okey] = coldata[okey]
+                # the virtual column shows its own column of the foreign
+                # table; the list of the real column is shared, so it is
+                # replaced, not changed
+                fkey_data = vrtdata['fkey']
+                if fkey_data:
+                    vrtdata['fkey'] = fkey_data[:2] + \
+                        [vrtdata['foreignInsert']] + fkey_data[3:]
             else:
                 vrtdata['qtype'] = 'void *'
                 vrtdata['defval'] = 'NULL'
@@ -800,6 +1163,19 @@ class QtDriver(Driver):
                 vrtdata['autoincrement'] = False
                 vrtdata['format'] = False
 
+        # fill_table_data() only depends on the columns (foreign keys
+        # included) and the common data, so the output of a previous
+        # run can be kept if these are the same
+        fingerprint = self.fingerprint(
+            sorted(self.data.items()),
+            [(col, sorted(self.columns[col].items()))
+             for col in self.columns])
+        self.tables[name]['fingerprint'] = fingerprint
+        fnames = [
+            os.path.join(self.out_dir, self.data['table'] + suffix)
+            for suffix in ('.h', '-meta.h', '.cc', '-meta.cc')]
+        if self.is_current('table ' + name, fingerprint, fnames):
+            return
         #for vrtcol in  self.vrtcols:
         #    if (vrtcol == 'area'):
         #        print ';;;;;', vrtcol, '------------------------------'
@@ -821,31 +1197,30 @@ class QtDriver(Driver):
         #    if (vrtcol == 'area'):
         #        print ';;;;;', vrtcol, '----', self.columns[vrtcol]['datatype']
 
+        self.render('render_table', name)
 
+    def render_table(self, name):
+        '''Generates the files for table `name`'''
         self.fill_table_data(name)
 
         if len(self.data['SetTableOverrides']) == 0:
             self.data['SetTableOverrides'] = '    Q_UNUSED(result);'
 
         fname = os.path.join(self.out_dir, self.data['table'] + '.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('table.h.template') % self.data)
+        self.write_output(
+            fname, self.get_template('table.h.template') % self.data)
 
         fname = os.path.join(self.out_dir, self.data['table'] + '-meta.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('table-meta.h.template') % self.data)
+        self.write_output(
+            fname, self.get_template('table-meta.h.template') % self.data)
 
         fname = os.path.join(self.out_dir, self.data['table'] + '.cc')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('table.cc.template') % self.data)
+        self.write_output(
+            fname, self.get_template('table.cc.template') % self.data)
 
         fname = os.path.join(self.out_dir, self.data['table'] + '-meta.cc')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('table-meta.cc.template') % self.data)
+        self.write_output(
+            fname, self.get_template('table-meta.cc.template') % self.data)
 
     def column(self, name, label, datatype, nulls, node, dtnode):
         '''Processing a column'''
@@ -921,51 +1296,25 @@ class QtDriver(Driver):
         self.views[name] = {}
         self.bootstrap_data(name)
         self.columns = OrderedDict()
+        self.reuse_view = False
 
     def view_end(self, name, node):
         '''Done processing view `name`'''
 
         self.views[name]['columns'] = self.columns
+        if self.reuse_view:
+            return
+        self.render('render_view', name, *self.view_source)
 
-        name = name.lower()
-
-        if len(self.data['SetTableOverrides']) == 0:
-            self.data['SetTableOverrides'] = '    Q_UNUSED(result);'
-
-        fname = os.path.join(self.out_dir, name + '.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('view.h.template') % self.data)
-
-        fname = os.path.join(self.out_dir, name + '-meta.h')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('view-meta.h.template') % self.data)
-
-        fname = os.path.join(self.out_dir, name + '.cc')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('view.cc.template') % self.data)
-
-        fname = os.path.join(self.out_dir, name + '-meta.cc')
-        with open(fname, 'w') as foutp:
-            file.write(
-                foutp, self.get_template('view-meta.cc.template') % self.data)
-
-    def view_subset(self, node, subset):
-        '''Process a subset in a view'''
-        name1 = subset.name1
-        #col1 = subset.col1
-        name_in = subset.in_
-        #incol = subset.incol
-        #where = subset.where
-        #constraint = subset.constraint
-        #value = subset.value
-
-        self.columns = self.tables[name1]['columns']
+    def render_view(self, name, name1, writeback):
+        '''
+        Generates the files for view `name` of table `name1`; `writeback`
+        is None or the table and the (name, value, default) of the columns
+        that are written back.
+        '''
         self.fill_table_data(name1)
 
-        defaults = {}
+        defaults = OrderedDict()
         for col in self.columns:
             coldata = self.columns[col]
             defaults[col] = coldata['defval']
@@ -975,36 +1324,91 @@ class QtDriver(Driver):
         self.data['baseclass'] = 'dbview'
         self.data['BASECLASS'] = 'DBVIEW'
 
-        force_values = {}
-        if hasattr(node, 'writeback'):
-            self.data['TableModify'] = node.writeback.table
-            if hasattr(node.writeback, 'column'):
-                for column in node.writeback.column:
-                    if hasattr(column, 'value'):
-                        force_values[column.name] = column.value
-                    if hasattr(column, 'default'):
-                        defaults[column.name] = column.default
-
-        set_table_overrides = ''
+        force_values = OrderedDict()
+        if writeback is not None:
+            self.data['TableModify'] = writeback[0]
+            for col, value, default in writeback[1]:
+                force_values[col] = value
+                defaults[col] = default
+
+        set_table_overrides = []
         for col in force_values:
             col_var_name = col.lower()
             colval = force_values[col]
             if colval is not None:
-                set_table_overrides += make_value_setter(col_var_name, colval, \
-                    self.columns[col]['qtype'])
-        set_table_defaults = ''
+                set_table_overrides.append(make_value_setter(
+                    col_var_name, colval, self.columns[col]['qtype']))
+        set_table_overrides = ''.join(set_table_overrides)
+        set_table_defaults = []
         for col in defaults:
             col_var_name = col.lower()
             colval = defaults[col]
             if colval is not None:
-                set_table_defaults += make_value_setter(col_var_name, colval, \
-                    self.columns[col]['qtype'])
+                set_table_defaults.append(make_value_setter(
+                    col_var_name, colval, self.columns[col]['qtype']))
+        set_table_defaults = ''.join(set_table_defaults)
 
         if len(set_table_overrides) == 0:
             set_table_overrides = '    Q_UNUSED(result);'
         self.data['SetTableDefaults'] = set_table_defaults
         self.data['SetTableOverrides'] = set_table_overrides
 
+        name = name.lower()
+
+        if len(self.data['SetTableOverrides']) == 0:
+            self.data['SetTableOverrides'] = '    Q_UNUSED(result);'
+
+        fname = os.path.join(self.out_dir, name + '.h')
+        self.write_output(
+            fname, self.get_template('view.h.template') % self.data)
+
+        fname = os.path.join(self.out_dir, name + '-meta.h')
+        self.write_output(
+            fname, self.get_template('view-meta.h.template') % self.data)
+
+        fname = os.path.join(self.out_dir, name + '.cc')
+        self.write_output(
+            fname, self.get_template('view.cc.template') % self.data)
+
+        fname = os.path.join(self.out_dir, name + '-meta.cc')
+        self.write_output(
+            fname, self.get_template('view-meta.cc.template') % self.data)
+
+    def view_subset(self, node, subset):
+        '''Process a subset in a view'''
+        name1 = subset.name1
+        #col1 = subset.col1
+        name_in = subset.in_
+        #incol = subset.incol
+        #where = subset.where
+        #constraint = subset.constraint
+        #value = subset.value
+
+        self.columns = self.tables[name1]['columns']
+
+        # the view is made of the table, the subset and the writeback
+        writeback = getattr(node, 'writeback', None)
+        if writeback is not None:
+            writeback = (writeback.table, [
+                (column.name, column.value, column.default)
+                for column in writeback.column])
+        self.view_source = (name1, writeback)
+        # render_view() uses the common data, the columns of the table
+        # and view_source; the subset itself is part of it so that the
+        # manifest changes with the input
+        fingerprint = self.fingerprint(
+            sorted(self.data.items()),
+            self.tables[name1]['fingerprint'],
+            [(col, sorted(self.columns[col].items()))
+             for col in self.columns],
+            self.view_source,
+            (subset.name1, subset.col1, subset.in_, subset.incol,
+             subset.where, subset.constraint, subset.value))
+        fnames = [
+            os.path.join(self.out_dir, self.data['table'] + suffix)
+            for suffix in ('.h', '-meta.h', '.cc', '-meta.cc')]
+        self.reuse_view = self.is_current(
+            'view ' + self.data['Table'], fingerprint, fnames)
 
         if name_in is None:
             # only a primary table
@@ -1013,15 +1417,72 @@ class QtDriver(Driver):
             # a primary and a secondary
             pass
 
+    def render(self, method, *args):
+        '''
+        Calls one of the `render_` methods, in a worker process if more
+        than one job was requested. The state they use (database name,
+        columns and variable map) goes along with the call.
+        '''
+        if self.jobs <= 1:
+            getattr(self, method)(*args)
+            return
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                self.jobs, init_render_worker, (self.options, AUTHOR))
+        self.pending.append(self.pool.apply_async(render_in_worker, (
+            method, self.db_name, self.columns, self.data, args)))
+
+    def wait_for_workers(self):
+        '''Waits for the files that are generated in worker processes'''
+        if self.pool is None:
+            return
+        try:
+            for result in self.pending:
+                written, skipped = result.get()
+                self.written += written
+                self.skipped += skipped
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.pending = []
+
     def get_template(self, which):
-        '''Read the content of a template file'''
+        '''The compiled form of a template file (see `load_template`)'''
         if not which in self.templates:
-            with open(os.path.join(self.template_dir, which), 'r') as finp:
-                self.templates[which] = finp.read()
+            self.templates[which] = load_template(
+                os.path.join(self.template_dir, which), self.cache_dir)
         return self.templates[which]
 
 # ----------------------------------------------------------------------------
 
+def init_render_worker(options, author):
+    '''
+    Prepares a process of the pool used by `QtDriver.render`.
+    '''
+    global AUTHOR, RENDER_DRIVER
+    AUTHOR = author
+    RENDER_DRIVER = QtDriver(**options)
+
+# ----------------------------------------------------------------------------
+
+def render_in_worker(method, db_name, columns, data, args):
+    '''
+    Runs a `render_` method of `QtDriver` in a worker process.
+
+    Returns the number of files that were written and skipped.
+    '''
+    driver = RENDER_DRIVER
+    driver.written = 0
+    driver.skipped = 0
+    driver.db_name = db_name
+    driver.columns = columns
+    driver.data = data
+    getattr(driver, method)(*args)
+    return driver.written, driver.skipped
+
+# ----------------------------------------------------------------------------
+
 class SqLiteDriver(SqlDriver):
     '''
     SqLite specifics.
@@ -1035,96 +1496,893 @@ class SqLiteDriver(SqlDriver):
 def validate(xmlfilename):
     '''
     Validates a file and returns the xml tree.
+
+    libxml2 reads the file itself so its content never exists
+    as a python string.
     '''
-    with open(xmlfilename, 'r') as finp:
-        return validate_string(finp.read())
+    return parse_checked(lambda parser: etree.parse(xmlfilename, parser))
 
 # ----------------------------------------------------------------------------
 
-def validate_string(xmlstring):
+def parse_checked(parse):
     '''
-    Validates a string and returns the xml tree.
+    Calls `parse` with the xml parser to use and builds the tree for
+    the element (or element tree) that it returns.
+
+    Returns None and logs the problem if the input is not valid.
     '''
+    if PARSER is None:
+        # same behaviour as the parse functions in pile_schema_api
+        parser = etree.ETCompatXMLParser()
+    else:
+        parser = PARSER
     try:
-        xml_root = pile_schema_api.parseString(xmlstring, silence=True)
-
-        return xml_root
+        xml_node = parse(parser)
+        if hasattr(xml_node, 'getroot'):
+            xml_node = xml_node.getroot()
+        return build_tree(xml_node)
     except (etree.XMLSchemaError, etree.XMLSyntaxError) as exc:
-        LOGGER.error('Schema validation failed: ' + str(exc))
+        LOGGER.error('Schema validation failed: ' + parse_error(exc, parse))
         return None
 
 # ----------------------------------------------------------------------------
 
-def str2bool(value):
-    '''Get a proper boolean value based on a string value.'''
-    if value is None:
-        return False
-    if isinstance(value, bool):
-        return value
-    return value.lower() in ("yes", "true", "t", "1")
+def parse_error(exc, parse=None):
+    '''
+    The description of an error raised while parsing a document.
+
+    A parser that checks the schema reports its errors at line 0. When
+    `parse` (see `parse_checked`) is given, the document is parsed
+    again without the schema and the tree is checked to find the line;
+    otherwise the line is left out.
+    '''
+    message = str(exc)
+    if getattr(exc, 'lineno', None) or SCHEMA is None:
+        return message
+    message = re.sub(r' \(line 0\)$', '', message)
+    if parse is None:
+        return message
+    try:
+        xml_node = parse(etree.XMLParser(remove_comments=True))
+    except etree.XMLSyntaxError:
+        return message
+    if SCHEMA.validate(xml_node):
+        return message
+    error = SCHEMA.error_log[0]
+    return '%s (line %d)' % (error.message, error.line)
 
 # ----------------------------------------------------------------------------
 
-def string_choice(str1, str2, choice):
-    '''Returns either first or second string based on choice.'''
-    return str(str1) if choice else str(str2)
+def build_tree(xml_node):
+    '''
+    Creates the `pile_schema_api` objects for a parsed xml element.
+
+    The classes are taken from `MODEL`, which is either `pile_schema_api`
+    or its compact equivalent.
+    '''
+    root_tag, root_class = MODEL.get_root_tag(xml_node)
+    if root_class is None:
+        root_class = MODEL.parameterlessType
+    return root_class.factory().build(xml_node)
 
 # ----------------------------------------------------------------------------
 
-def process_with_driver(driver, database):
+def default_cache_dir():
     '''
-    Use a driver to process the database.
+    The directory where results are kept between runs.
     '''
-    driver.database_start(database.name, database)
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pileschema')
 
-    tables = database.tables
-    views = database.views
+# ----------------------------------------------------------------------------
 
-    for table in tables.table:
-        # print(table.name)
-        driver.table_start(table.name, table)
-
-        columns = table.columns
-        for column in columns.column:
-            #print('', column.name)
-            if column.name == 'duration':
-                pass
-
-            datatype_name = ''
-            datatype = None
-            for kkk in dir(column):
-                # This is a hack; it exists because the generated class does no
-                # provide any means to iterate child elements
-                # It relies on the assumption that all elements are custom types
-                if str(type(getattr(column, kkk))).find('class') > 0:
-                    datatype = getattr(column, kkk)
-                    datatype_name = kkk
-                    break
+def atomic_write(fname, content, mode='wb'):
+    '''
+    Writes `content` to a temporary file and moves it over `fname`.
+    '''
+    tmp_name = '%s.%d.tmp' % (fname, os.getpid())
+    with open(tmp_name, mode) as foutp:
+        foutp.write(content)
+    if platform.system() == 'Windows' and os.path.exists(fname):
+        os.remove(fname)
+    os.rename(tmp_name, fname)
 
-            driver.column(
-                column.name,
-                string_choice(
-                    column.label,
-                    column.name,
-                    column.label),
-                datatype_name,
-                str2bool(column.allowNulls),
-                column, datatype)
+# ----------------------------------------------------------------------------
 
-        driver.table_end(table.name, table)
+def write_if_changed(fname, content):
+    '''
+    Saves the text in `content` to `fname` unless the file already
+    holds it, so that its modification time only changes along with
+    its content. The file is replaced atomically.
 
-    for view in views.view:
-        driver.view_start(view.name, view)
-        subset = view.subset
-        if subset is not None:
-            driver.view_subset(view, subset)
-        else:
-            LOGGER.error('Unknown view type')
-            return -1
-        driver.view_end(view.name, view)
+    Returns True if the file was written.
+    '''
+    try:
+        with open(fname, 'r') as finp:
+            existing = hashlib.sha1(finp.read()).digest()
+    except IOError:
+        existing = None
+    if existing == hashlib.sha1(content).digest():
+        return False
+    atomic_write(fname, content, 'w')
+    return True
 
-    driver.database_end(database.name, database)
+# ----------------------------------------------------------------------------
 
+def load_manifest(out_dir):
+    '''
+    The fingerprints saved by `save_manifest` in `out_dir`
+    (empty if there are none).
+    '''
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), 'r') as finp:
+            manifest = json.load(finp)
+    except (IOError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('components', {})
+
+# ----------------------------------------------------------------------------
+
+def save_manifest(out_dir, components):
+    '''
+    Saves the fingerprint of the inputs of each component whose files
+    were generated in `out_dir`.
+    '''
+    write_if_changed(os.path.join(out_dir, MANIFEST_FILE), json.dumps({
+        'version': MANIFEST_VERSION,
+        'components': components,
+    }, indent=2, sort_keys=True) + '\n')
+
+# ----------------------------------------------------------------------------
+
+class CompiledTemplate(object):
+    '''
+    A template split in advance around its `%(Key)s` variables.
+
+    `parts` are the literal pieces of the output, with None in the
+    places listed in `slots` as (index in `parts`, variable name);
+    `digest` identifies the text of the template. A template that uses
+    other conversions is kept whole as `parts[0]` and `slots` is None.
+
+    `template % data` renders it just like the text of the template.
+    '''
+    def __init__(self, parts, slots, digest):
+        self.parts = parts
+        self.slots = slots
+        self.digest = digest
+
+    def __mod__(self, data):
+        if self.slots is None:
+            return self.parts[0] % data
+        result = list(self.parts)
+        for index, key in self.slots:
+            result[index] = data[key]
+        try:
+            return ''.join(result)
+        except TypeError:
+            # not all values are strings
+            return ''.join('%s' % (part,) for part in result)
+
+# ----------------------------------------------------------------------------
+
+def compile_template(text):
+    '''
+    Locates the variables in the `text` of a template.
+    '''
+    digest = hashlib.sha1(text).hexdigest()
+    if '%' in TEMPLATE_SLOT.sub('', text):
+        # other conversions are left to the % operator
+        return CompiledTemplate([text], None, digest)
+
+    parts = []
+    slots = []
+    literal = ''
+    start = 0
+    for match in TEMPLATE_SLOT.finditer(text):
+        literal += text[start:match.start()]
+        start = match.end()
+        if match.group(1) is None:
+            literal += '%'
+            continue
+        if literal:
+            parts.append(literal)
+            literal = ''
+        slots.append((len(parts), match.group(1)))
+        parts.append(None)
+    literal += text[start:]
+    if literal:
+        parts.append(literal)
+    return CompiledTemplate(parts, slots, digest)
+
+# ----------------------------------------------------------------------------
+
+def load_template(fname, cache_dir=None):
+    '''
+    The compiled form of template file `fname`.
+
+    Templates are compiled once per process; the result is also kept
+    in `cache_dir` and used by later runs while the modification time
+    and size of the file, or else its content, stay the same.
+    '''
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    stamp = (stat.st_mtime, stat.st_size)
+    known = COMPILED_TEMPLATES.get(fname)
+    if known is not None and known[0] == stamp:
+        return known[1]
+
+    cache_file = None
+    if cache_dir:
+        # a str path (python 2) is already the bytes that name the file
+        key = fname
+        if not isinstance(key, bytes):
+            key = key.encode(sys.getfilesystemencoding() or 'utf-8')
+        cache_file = os.path.join(cache_dir, 'template-%s.pickle' % (
+            hashlib.sha1(key).hexdigest()))
+    cached = load_cached(cache_file)
+    if cached is not None and cached[0] != TEMPLATE_CACHE_VERSION:
+        cached = None
+    if cached is not None and cached[1] == stamp:
+        template = CompiledTemplate(*cached[2:])
+    else:
+        with open(fname, 'r') as finp:
+            text = finp.read()
+        if cached is not None and \
+                cached[4] == hashlib.sha1(text).hexdigest():
+            # touched, but not changed
+            template = CompiledTemplate(*cached[2:])
+        else:
+            template = compile_template(text)
+        if cache_file:
+            save_cached(cache_file, (
+                TEMPLATE_CACHE_VERSION, stamp,
+                template.parts, template.slots, template.digest))
+
+    COMPILED_TEMPLATES[fname] = (stamp, template)
+    return template
+
+# ----------------------------------------------------------------------------
+
+def load_schema(schema_file):
+    '''
+    Compiles `schema_file` and returns the resulting XMLSchema.
+
+    Compiled schemas are kept for the lifetime of the process, keyed by
+    the hash of the file content. The xs:annotation elements are
+    removed before compiling, as they only hold documentation; that
+    makes compiling about a third faster. libxml2 can't save a compiled
+    schema, so each process compiles it again.
+    '''
+    with open(schema_file, 'rb') as finp:
+        content = finp.read()
+    key = hashlib.sha1(content).hexdigest()
+    if key in COMPILED_SCHEMAS:
+        return COMPILED_SCHEMAS[key]
+
+    schema_root = etree.XML(content)
+    etree.strip_elements(
+        schema_root, '{%s}annotation' % XSD_NSPACE, with_tail=False)
+    schema = etree.XMLSchema(schema_root)
+    COMPILED_SCHEMAS[key] = schema
+    return schema
+
+# ----------------------------------------------------------------------------
+
+def stream_with_driver(driver, xmlfilename):
+    '''
+    Processes a file with `process_stream`, reporting syntax errors.
+
+    Schema errors may only surface at the end of the file, so the file
+    is first read once by `check_stream`; an invalid file leaves no
+    output behind.
+    '''
+    if MODEL is pile_schema_sub.lazy_model():
+        # the elements are discarded as soon as they are processed
+        LOGGER.error('Lazy objects can not be used while streaming')
+        return -1
+    try:
+        if SCHEMA is not None:
+            check_stream(xmlfilename)
+        return process_stream(driver, xmlfilename)
+    except etree.XMLSyntaxError as exc:
+        # the document is not loaded again to find the line
+        LOGGER.error('Schema validation failed: ' + parse_error(exc))
+        return -1
+
+# ----------------------------------------------------------------------------
+
+def str2bool(value):
+    '''Get a proper boolean value based on a string value.'''
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    return value.lower() in ("yes", "true", "t", "1")
+
+# ----------------------------------------------------------------------------
+
+def string_choice(str1, str2, choice):
+    '''Returns either first or second string based on choice.'''
+    return str(str1) if choice else str(str2)
+
+# ----------------------------------------------------------------------------
+
+def process_table(driver, table):
+    '''
+    Use a driver to process a single table.
+    '''
+    # print(table.name)
+    driver.table_start(table.name, table)
+
+    columns = table.columns
+    for column in columns.column:
+        #print('', column.name)
+        # the datatype element was recorded when the column was built
+        # (see pile_schema_sub.columnSub)
+        driver.column(
+            column.name,
+            string_choice(
+                column.label,
+                column.name,
+                column.label),
+            column.datatype_name_,
+            str2bool(column.allowNulls),
+            column, column.datatype_)
+
+    driver.table_end(table.name, table)
+
+# ----------------------------------------------------------------------------
+
+def process_view(driver, view):
+    '''
+    Use a driver to process a single view.
+
+    Returns -1 if the view is of an unknown kind, 0 otherwise.
+    '''
+    driver.view_start(view.name, view)
+    subset = view.subset
+    if subset is not None:
+        driver.view_subset(view, subset)
+    else:
+        LOGGER.error('Unknown view type')
+        return -1
+    driver.view_end(view.name, view)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def process_with_driver(driver, database):
+    '''
+    Use a driver to process the database.
+    '''
+    driver.database_start(database.name, database)
+
+    tables = database.tables
+    views = database.views
+
+    for table in tables.table:
+        process_table(driver, table)
+
+    for view in views.view:
+        if process_view(driver, view) != 0:
+            return -1
+
+    driver.database_end(database.name, database)
+
+# ----------------------------------------------------------------------------
+
+def process_stream(driver, xmlfilename):
+    '''
+    Use a driver to process the database while reading the file.
+
+    Unlike `process_with_driver` the whole document is never held in
+    memory; each `table` and `view` element is turned into its
+    `pile_schema_api` object, handed to the driver and then discarded,
+    so memory is bounded by the largest single table.
+
+    The document is not checked against the schema here; see
+    `check_stream`.
+
+    Returns -1 on error, 0 otherwise.
+    '''
+    database = None
+    for event, elem in etree.iterparse(
+            xmlfilename, events=('start', 'end'), remove_comments=True):
+        tag = etree.QName(elem).localname
+        if event == 'start':
+            if tag == 'database':
+                # only the attributes are available at this point;
+                # tables and views are processed as they are completed
+                database = MODEL.database.factory()
+                database.buildAttributes(elem, elem.attrib, set())
+                driver.database_start(database.name, database)
+            continue
+
+        if database is None:
+            LOGGER.error('%s: root element is not a database', xmlfilename)
+            return -1
+
+        if tag == 'table':
+            process_table(
+                driver, MODEL.table.factory().build(elem))
+        elif tag == 'view':
+            if process_view(
+                    driver, MODEL.view.factory().build(elem)) != 0:
+                return -1
+        elif tag in ('sqlPrefix', 'sqlSuffix'):
+            # these are tiny; no need to drop them
+            database.buildChildren(elem, elem.getparent(), tag)
+            continue
+        else:
+            # wait for the parent to complete
+            continue
+
+        # drop the element and everything that was processed before it
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+    if database is None:
+        LOGGER.error('%s: root element is not a database', xmlfilename)
+        return -1
+    driver.database_end(database.name, database)
+    return 0
+
+
+# ----------------------------------------------------------------------------
+
+def check_stream(xmlfilename):
+    '''
+    Checks a file against the schema loaded by `extract_common` without
+    keeping the whole document in memory.
+
+    Raises `etree.XMLSyntaxError` if the file is not valid.
+    '''
+    for _, elem in etree.iterparse(
+            xmlfilename, schema=SCHEMA, remove_comments=True):
+        # completed elements are not needed to check the rest
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+# ----------------------------------------------------------------------------
+
+class Record(object):
+    '''
+    A plain object with the given attributes; stands in for a
+    `pile_schema_api` object when replaying cached data.
+    '''
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+# ----------------------------------------------------------------------------
+
+class RecordingDriver(object):
+    '''
+    Forwards the calls to another driver while collecting the data
+    that `replay_parsed` needs to repeat them.
+
+    `data` only holds plain python types so that it can be pickled:
+    the attributes of the database, the tables with their columns
+    (resolved datatype, its qtype and defaults, foreign keys) and the
+    views with their subset and writeback. The simple members of each
+    object are stored as a tuple of values that starts with an index
+    in `data['fields']`, the list of member names for that kind of object.
+    '''
+    def __init__(self, driver):
+        self.driver = driver
+        self.data = {'database': None, 'tables': [], 'views': [], 'fields': []}
+        self.fields = {}
+        self.columns = None
+        super(RecordingDriver, self).__init__()
+
+    def values(self, node):
+        '''The members of `node` that hold simple values (not objects)'''
+        cls = type(node)
+        try:
+            index, names = self.fields[cls]
+        except KeyError:
+            # members named like a keyword get an underscore (`in_`)
+            names = tuple(sorted(
+                name + '_' if keyword.iskeyword(name) else name
+                for name, spec in cls.member_data_items_.items()
+                if spec.get_data_type() not in ELEMENT_TYPES))
+            index = len(self.data['fields'])
+            self.data['fields'].append(names)
+            self.fields[cls] = (index, names)
+        return (index,) + tuple(getattr(node, name) for name in names)
+
+    def database_start(self, name, node):
+        '''Starting to process database `name`'''
+        self.driver.database_start(name, node)
+
+    def database_end(self, name, node):
+        '''Done processing database `name`'''
+        # sqlPrefix and sqlSuffix are only known at this point
+        self.data['database'] = self.values(node)
+        self.driver.database_end(name, node)
+
+    def table_start(self, name, node):
+        '''Starting to process table `name`'''
+        self.columns = []
+        self.driver.table_start(name, node)
+
+    def table_end(self, name, node):
+        '''Done processing table `name`'''
+        try:
+            pkey = node.primaryKey.key.column[0].name
+        except (AttributeError, IndexError):
+            pkey = None
+        self.data['tables'].append((name, pkey, self.columns))
+        self.driver.table_end(name, node)
+
+    def column(self, name, label, datatype, nulls, node, dtnode):
+        '''Processing a column'''
+        dtvalues = None
+        identity = None
+        if dtnode is not None:
+            dtvalues = self.values(dtnode)
+            if 'identity' in dtnode.member_data_items_:
+                identity = dtnode.identity is not None
+        self.columns.append((
+            name, label, datatype, nulls,
+            self.values(node), dtvalues, identity))
+        self.driver.column(name, label, datatype, nulls, node, dtnode)
+
+    def view_start(self, name, node):
+        '''Starting to process view `name`'''
+        self.driver.view_start(name, node)
+
+    def view_end(self, name, node):
+        '''Done processing view `name`'''
+        writeback = node.writeback
+        if writeback is not None:
+            writeback = (
+                writeback.table,
+                [self.values(column) for column in writeback.column])
+        self.data['views'].append(
+            (name, self.values(node.subset), writeback))
+        self.driver.view_end(name, node)
+
+    def view_subset(self, node, subset):
+        '''Process a subset in a view'''
+        self.driver.view_subset(node, subset)
+
+# ----------------------------------------------------------------------------
+
+def record_maker(fields):
+    '''
+    A function that creates a Record from the output of
+    `RecordingDriver.values`, given the `fields` of the same data.
+    '''
+    def make_record(values, **kwargs):
+        '''Creates a Record from the output of `RecordingDriver.values`'''
+        kwargs.update(zip(fields[values[0]], values[1:]))
+        return Record(**kwargs)
+    return make_record
+
+# ----------------------------------------------------------------------------
+
+def replay_tables(driver, data):
+    '''
+    Use a driver to process the tables collected by a `RecordingDriver`.
+    '''
+    make_record = record_maker(data['fields'])
+    for name, pkey, columns in data['tables']:
+        if pkey is not None:
+            pkey = Record(key=Record(column=[Record(name=pkey)]))
+        table = Record(name=name, primaryKey=pkey)
+        driver.table_start(name, table)
+        for column in columns:
+            name, label, datatype, nulls, values, dtvalues, identity = column
+            dtnode = None
+            if dtvalues is not None:
+                dtnode = make_record(dtvalues)
+                if identity is not None:
+                    dtnode.identity = Record() if identity else None
+            driver.column(
+                name, label, datatype, nulls, make_record(values), dtnode)
+        driver.table_end(table.name, table)
+
+# ----------------------------------------------------------------------------
+
+def replay_views(driver, data):
+    '''
+    Use a driver to process the views collected by a `RecordingDriver`.
+
+    Returns -1 on error, 0 otherwise.
+    '''
+    make_record = record_maker(data['fields'])
+    for name, subset, writeback in data['views']:
+        if writeback is not None:
+            writeback = Record(
+                table=writeback[0],
+                column=[make_record(values) for values in writeback[1]])
+        view = Record(
+            name=name, subset=make_record(subset), writeback=writeback)
+        if process_view(driver, view) != 0:
+            return -1
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def replay_parsed(driver, data):
+    '''
+    Use a driver to process the data collected by a `RecordingDriver`.
+
+    The driver receives `Record` objects that have the same members as
+    the `pile_schema_api` objects it saw when the data was recorded.
+
+    Returns -1 on error, 0 otherwise.
+    '''
+    database = record_maker(data['fields'])(data['database'])
+    driver.database_start(database.name, database)
+    replay_tables(driver, data)
+    if replay_views(driver, data) != 0:
+        return -1
+    driver.database_end(database.name, database)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def cache_file_name(cache_dir, kind, *contents):
+    '''
+    The file in `cache_dir` that holds data of the given `kind` that
+    was derived from `contents`.
+
+    The name depends on `contents` and on the schema used to validate
+    them, so any change to either selects another file.
+    Returns None if no cache is used.
+    '''
+    if not cache_dir:
+        return None
+    digest = hashlib.sha1(
+        ('%s %d' % (kind, PARSED_CACHE_VERSION)).encode('ascii'))
+    digest.update(SCHEMA_DIGEST)
+    for content in contents:
+        digest.update(content)
+    return os.path.join(
+        cache_dir, '%s-%s.pickle' % (kind, digest.hexdigest()))
+
+# ----------------------------------------------------------------------------
+
+def load_cached(cache_file):
+    '''
+    The data saved in `cache_file` or None if it can't be used.
+    '''
+    if not cache_file:
+        return None
+    try:
+        with open(cache_file, 'rb') as finp:
+            return pickle.load(finp)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        return None
+
+# ----------------------------------------------------------------------------
+
+def save_cached(cache_file, data):
+    '''
+    Saves `data` in `cache_file` (in a directory that is created
+    if needed); failures are not errors.
+    '''
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        atomic_write(cache_file, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    except (IOError, OSError) as exc:
+        LOGGER.debug('Unable to cache parsed content: %s', exc)
+
+# ----------------------------------------------------------------------------
+
+def load_fragment(fname, container, cache_dir):
+    '''
+    The data that a `RecordingDriver` collects from the `table`s or
+    `view`s in file `fname`, included in the `container` (`tables` or
+    `views`) of a database.
+
+    The root of the file is either a single `table` or `view` or a
+    `container` element. The file is validated on its own, by placing
+    its content in an otherwise empty database, and the result is
+    cached by content. Returns None on error.
+    '''
+    try:
+        with open(fname, 'rb') as finp:
+            content = finp.read()
+    except IOError as exc:
+        LOGGER.error('Unable to read included file: %s', exc)
+        return None
+    INPUT_FILES.append(fname)
+    cache_file = cache_file_name(cache_dir, 'fragment', container, content)
+    data = load_cached(cache_file)
+    if data is not None:
+        LOGGER.debug('Using cached content of %s', fname)
+        return data
+
+    try:
+        fragment = etree.fromstring(
+            content, etree.XMLParser(remove_comments=True))
+    except etree.XMLSyntaxError as exc:
+        LOGGER.error('%s: %s', fname, exc)
+        return None
+    skeleton = etree.Element(
+        '{%s}database' % PILE_NSPACE, nsmap={None: PILE_NSPACE},
+        name=os.path.basename(fname))
+    holder = etree.SubElement(skeleton, '{%s}%s' % (PILE_NSPACE, container))
+    if fragment.tag == holder.tag:
+        holder.extend(list(fragment))
+    else:
+        holder.append(fragment)
+    etree.SubElement(skeleton, '{%s}sqlPrefix' % PILE_NSPACE)
+    etree.SubElement(skeleton, '{%s}sqlSuffix' % PILE_NSPACE)
+
+    # parsed again so that it gets the same treatment (validation,
+    # default values for attributes) as a whole file
+    database = parse_checked(
+        lambda parser: etree.fromstring(etree.tostring(skeleton), parser))
+    if database is None:
+        LOGGER.error('%s is not valid inside %s', fname, container)
+        return None
+
+    recorder = RecordingDriver(Driver())
+    if database.tables is not None:
+        for table in database.tables.table:
+            process_table(recorder, table)
+    if database.views is not None:
+        for view in database.views.view:
+            if process_view(recorder, view) != 0:
+                return None
+    if cache_file:
+        save_cached(cache_file, recorder.data)
+    return recorder.data
+
+# ----------------------------------------------------------------------------
+
+def is_modular(content):
+    '''
+    Tells if the xml text in `content` includes other files.
+    '''
+    return XINCLUDE_NSPACE.encode('ascii') in content
+
+# ----------------------------------------------------------------------------
+
+def process_modular(driver, xmlfilename, cache_dir):
+    '''
+    Use a driver to process a database whose tables and views are
+    kept, in part or in full, in other files that are included with
+    XInclude:
+
+    .. code-block:: xml
+
+        <tables>
+            <xi:include href="tables/product.xml"/>
+        </tables>
+
+    Included files are loaded by `load_fragment`, so a change to one
+    of them only re-parses that file. The including file is checked
+    with its include elements removed. Tables and views reach the
+    driver in the order in which they appear.
+
+    Returns -1 on error, 0 otherwise.
+    '''
+    try:
+        root = etree.parse(
+            xmlfilename, etree.XMLParser(remove_comments=True)).getroot()
+    except etree.XMLSyntaxError as exc:
+        LOGGER.error('%s: %s', xmlfilename, exc)
+        return -1
+
+    # None stands for an element of the including file
+    parts = {'tables': [], 'views': []}
+    for container in parts:
+        for holder in root.iterfind('{%s}%s' % (PILE_NSPACE, container)):
+            for child in list(holder):
+                if child.tag != '{%s}include' % XINCLUDE_NSPACE:
+                    parts[container].append(None)
+                    continue
+                href = child.get('href')
+                if not href:
+                    LOGGER.error('%s:%d: include without href',
+                                 xmlfilename, child.sourceline)
+                    return -1
+                fname = os.path.join(os.path.dirname(xmlfilename), href)
+                data = load_fragment(fname, container, cache_dir)
+                if data is None:
+                    return -1
+                parts[container].append(data)
+                holder.remove(child)
+
+    database = parse_checked(
+        lambda parser: etree.fromstring(etree.tostring(root), parser))
+    if database is None:
+        return -1
+
+    driver.database_start(database.name, database)
+
+    tables = iter([] if database.tables is None else database.tables.table)
+    for data in parts['tables']:
+        if data is None:
+            process_table(driver, next(tables))
+        else:
+            replay_tables(driver, data)
+
+    views = iter([] if database.views is None else database.views.view)
+    for data in parts['views']:
+        if data is None:
+            result = process_view(driver, next(views))
+        else:
+            result = replay_views(driver, data)
+        if result != 0:
+            return -1
+
+    driver.database_end(database.name, database)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def process_input(driver, args):
+    '''
+    Use a driver to process the input file named in `args`.
+
+    The content of the file is taken from the cache if it was parsed
+    before with the same schema; otherwise the file is validated and
+    processed (streamed if requested) and the cache is updated. Files
+    that include others are handled by `process_modular`.
+
+    Returns -1 on error, 0 otherwise.
+    '''
+    del INPUT_FILES[:]
+    INPUT_FILES.extend([args.xml, SCHEMA_FILE])
+    with open(args.xml, 'rb') as finp:
+        content = finp.read()
+    if is_modular(content):
+        return process_modular(driver, args.xml, args.cache_dir)
+
+    cache_file = cache_file_name(args.cache_dir, 'parsed', content)
+    # the file is parsed from disk; don't keep a copy around
+    content = None
+    data = load_cached(cache_file)
+    if data is not None:
+        LOGGER.debug('Using cached content of %s', args.xml)
+        return replay_parsed(driver, data)
+    if cache_file:
+        driver = RecordingDriver(driver)
+
+    if args.stream:
+        if stream_with_driver(driver, args.xml) != 0:
+            return -1
+    else:
+        database = validate(args.xml)
+        if database is None:
+            return -1
+        if process_with_driver(driver, database) == -1:
+            return -1
+
+    if cache_file:
+        save_cached(cache_file, driver.data)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def build_date(reproducible):
+    '''
+    The date written in generated files: the one in the
+    SOURCE_DATE_EPOCH environment variable if it is set, otherwise
+    the current date or, for `reproducible` output, None.
+    '''
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if epoch:
+        try:
+            return datetime.datetime.utcfromtimestamp(int(epoch))
+        except ValueError:
+            LOGGER.warning('Ignoring invalid SOURCE_DATE_EPOCH: %s', epoch)
+    if reproducible:
+        return None
+    return datetime.datetime.now()
 
 # ----------------------------------------------------------------------------
 
@@ -1132,42 +2390,85 @@ def extract_common(args):
     '''
     Extract common information from arguments and save it at module level.
     '''
-    global AUTHOR, PARSER, SCHEMA_FILE
-
-    if hasattr(args, 'author') and args.author is not None:
-        AUTHOR = args.author
+    global AUTHOR, BUILD_DATE, MODEL, PARSER, SCHEMA, SCHEMA_FILE, \
+        SCHEMA_DIGEST
+
+    reproducible = getattr(args, 'reproducible', False)
+    if hasattr(args, 'author'):
+        if args.author is not None:
+            AUTHOR = args.author
+        elif reproducible:
+            AUTHOR = ''
+        else:
+            AUTHOR = username()
+        BUILD_DATE = build_date(reproducible)
 
     if not hasattr(args, 'schema') or args.schema == None:
         args.schema = DEFAULT_SCHEMA_FILE
 
-    if SCHEMA_FILE != args.schema:
+    if not hasattr(args, 'cache_dir'):
+        args.cache_dir = None
+
+    if hasattr(args, 'compact') and args.compact:
+        MODEL = pile_schema_sub.compact_model()
+    elif hasattr(args, 'lazy') and args.lazy:
+        MODEL = pile_schema_sub.lazy_model()
+    else:
+        MODEL = pile_schema_api
+
+    # compared by content, as `watch` calls this again after the schema
+    # file was edited
+    with open(args.schema, 'rb') as finp:
+        digest = hashlib.sha1(finp.read()).digest()
+    if SCHEMA_FILE != args.schema or SCHEMA_DIGEST != digest:
         SCHEMA_FILE = args.schema
-        with open(args.schema, 'r') as finp:
-            schema_root = etree.XML(finp.read())
-
-#            def do_elem(elem, tmpl, prnt=False):
-#                if prnt:
-#                    print tmpl % (elem.tag)
-#                    print tmpl % (str(elem.keys()))
-#                    print tmpl % (str(elem.values()))
-#                if 'variablePrecisionTime' in elem.values():
-#                    for el1 in elem.iterchildren():
-#                        do_elem(el1, "\t%s", prnt=True)
-#                        for el2 in el1.iterchildren():
-#                            do_elem(el2, "\t\t%s", prnt=True)
-#                            for el3 in el2.iterchildren():
-#                                do_elem(el3, "\t\t\t%s", prnt=True)
-#
-#
-#            for el1 in schema_root.iterchildren():
-#                do_elem(el1, "\t%s")
-#                for el2 in el1.iterchildren():
-#                    do_elem(el2, "\t\t%s")
-#                    for el3 in el2.iterchildren():
-#                        do_elem(el3, "\t\t\t%s")
-
-        schema = etree.XMLSchema(schema_root)
-        PARSER = etree.XMLParser(schema=schema, attribute_defaults=True)
+        SCHEMA_DIGEST = digest
+        SCHEMA = load_schema(args.schema)
+        PARSER = etree.XMLParser(
+            schema=SCHEMA, attribute_defaults=True,
+            remove_comments=True, remove_pis=True)
+
+# ----------------------------------------------------------------------------
+
+def depfile_path(fname):
+    '''
+    A file name escaped for the Makefile syntax of a depfile.
+    '''
+    return fname.replace('\\', '/').replace('$', '$$').replace(
+        '#', '\\#').replace(' ', '\\ ')
+
+# ----------------------------------------------------------------------------
+
+def write_build_info(args, outputs, inputs):
+    '''
+    Writes the files a build system uses to decide when to run the
+    generator again, if they were requested in `args`:
+
+    - `args.depfile`, a Makefile (and Ninja) style depfile where the
+      generated files depend on the `inputs`;
+    - `args.outputs`, the list of generated files, one per line;
+    - `args.stamp`, a file touched by each run.
+
+    The depfile and the list are only rewritten when their content
+    changes. Generated files that did not change keep their time too,
+    so make would find them older than the inputs and run the generator
+    on every build; the stamp, the first target in the depfile, is the
+    target to use there.
+    '''
+    targets = list(outputs)
+    if args.stamp:
+        with open(args.stamp, 'a'):
+            os.utime(args.stamp, None)
+        targets.insert(0, args.stamp)
+    if args.depfile:
+        write_if_changed(args.depfile, '%s: \\\n%s\n' % (
+            ' \\\n'.join(depfile_path(fname) for fname in targets),
+            ' \\\n'.join(
+                '  ' + depfile_path(fname)
+                for fname in OrderedDict.fromkeys(inputs))))
+    if args.outputs:
+        write_if_changed(
+            args.outputs, ''.join(fname + '\n' for fname in outputs))
 
 # ----------------------------------------------------------------------------
 
@@ -1186,18 +2487,131 @@ def make_value_setter(var_name, var_value, qtype):
 
 # ----------------------------------------------------------------------------
 
+class ErrorCollector(logging.Handler):
+    '''
+    Keeps the text of the errors that are logged while it is installed.
+    '''
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+# ----------------------------------------------------------------------------
+
+def validate_file(xmlfilename):
+    '''
+    Validates one of the files given to `cmd_validate`.
+
+    The result is a dictionary with the outcome, the time it took and
+    the errors that were logged, as it appears in the summary.
+    '''
+    collector = ErrorCollector()
+    LOGGER.addHandler(collector)
+    start = time.time()
+    try:
+        with open(xmlfilename, 'rb') as finp:
+            modular = is_modular(finp.read())
+        if modular:
+            valid = process_modular(
+                Driver(), xmlfilename, VALIDATE_CACHE_DIR) == 0
+        else:
+            valid = validate(xmlfilename) is not None
+    except (IOError, OSError) as exc:
+        LOGGER.error('Unable to read %s: %s', xmlfilename, exc)
+        valid = False
+    finally:
+        LOGGER.removeHandler(collector)
+    return {
+        'file': xmlfilename,
+        'valid': valid,
+        'seconds': round(time.time() - start, 6),
+        'errors': collector.messages,
+    }
+
+# ----------------------------------------------------------------------------
+
+def init_validate_worker(args):
+    '''
+    Prepares a process of the pool used by `cmd_validate`; the schema
+    is compiled once, here.
+    '''
+    global VALIDATE_CACHE_DIR
+    extract_common(args)
+    VALIDATE_CACHE_DIR = args.cache_dir
+
+# ----------------------------------------------------------------------------
+
+def expand_inputs(patterns):
+    '''
+    The files named by a list of file names and glob patterns, in order
+    and without duplicates. Patterns that match nothing are kept so that
+    the missing file gets reported.
+    '''
+    result = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else []
+        for fname in matches or [pattern]:
+            if fname not in result:
+                result.append(fname)
+    return result
+
+# ----------------------------------------------------------------------------
+
 def cmd_validate(args):
     '''
     Example:
     validate file.xml
+    validate --jobs 8 --summary report.json "schemas/*.xml"
     '''
-    extract_common(args)
-    if validate(args.xml):
-        LOGGER.info("%s validates", args.xml)
-        return 1
+    files = expand_inputs(args.xml)
+    jobs = min(args.jobs or multiprocessing.cpu_count(), len(files))
+    # only what the workers need; args also holds the sub-command
+    worker_args = argparse.Namespace(
+        schema=args.schema, cache_dir=args.cache_dir, lazy=args.lazy)
+
+    start = time.time()
+    if jobs > 1:
+        pool = multiprocessing.Pool(
+            jobs, init_validate_worker, (worker_args,))
+        try:
+            results = pool.map(validate_file, files, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
     else:
-        LOGGER.warning("%s doesn't validate", args.xml)
-        return 0
+        init_validate_worker(worker_args)
+        results = [validate_file(fname) for fname in files]
+    elapsed = time.time() - start
+
+    failed = 0
+    for result in results:
+        if result['valid']:
+            LOGGER.info("%s validates", result['file'])
+        else:
+            LOGGER.warning("%s doesn't validate", result['file'])
+            failed += 1
+    if len(files) > 1:
+        LOGGER.info(
+            '%d of %d files validate (%d jobs, %.2f s)',
+            len(files) - failed, len(files), jobs, elapsed)
+
+    if args.summary:
+        summary = json.dumps({
+            'files': results,
+            'passed': len(files) - failed,
+            'failed': failed,
+            'jobs': jobs,
+            'seconds': round(elapsed, 6),
+        }, indent=2, sort_keys=True)
+        if args.summary == '-':
+            print(summary)
+        else:
+            with open(args.summary, 'w') as foutp:
+                foutp.write(summary + '\n')
+
+    return 0 if failed == 0 else 1
 
 # ----------------------------------------------------------------------------
 
@@ -1217,17 +2631,16 @@ def cmd_sql(args):
         LOGGER.error('Unknown driver: ' + args.driver)
         return -1
 
-    database = validate(args.xml)
-    if database is None:
+    if process_input(driver, args) != 0:
         return -1
 
-    process_with_driver(driver, database)
-
     out_file = args.output
     if out_file is None:
         out_file = os.path.splitext(args.xml)[0] + '.sql'
     with open(out_file, 'w') as foutp:
         foutp.write(driver.sql_string)
+
+    write_build_info(args, [out_file], INPUT_FILES)
     return 0
 
 # ----------------------------------------------------------------------------
@@ -1246,21 +2659,174 @@ def cmd_qt(args):
             template_dir=args.templates,
             namespace=args.namespace,
             export_macro=args.exportm,
-            import_header=args.importh)
+            import_header=args.importh,
+            jobs=args.jobs or multiprocessing.cpu_count(),
+            cache_dir=args.cache_dir,
+            unity_chunks=args.unity_chunks)
     else:
         LOGGER.error('Unknown driver: ' + args.driver)
         return -1
 
-    database = validate(args.xml)
-    if database is None:
+    if process_input(driver, args) != 0:
         return -1
 
-    process_with_driver(driver, database)
+    LOGGER.info(
+        '%d files written, %d unchanged', driver.written, driver.skipped)
+
+    # all templates take part in the fingerprints, used or not
+    templates = sorted(glob.glob(os.path.join(args.templates, '*.template')))
+    write_build_info(args, driver.outputs, INPUT_FILES + templates)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def file_stamp(fname):
+    '''
+    The modification time and size of a file, None if it is missing.
+    '''
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+# ----------------------------------------------------------------------------
 
+def cmd_watch(args):
+    '''
+    Example:
+    watch file.xml outdir
+
+    Generates the C++ sources like `cpp` and then again each time the
+    input, a file it includes or a template changes. The compiled
+    schema and templates stay loaded between runs. The input is read
+    again by each run, from the parse cache in `--cache-dir` when its
+    content did not change, and the manifest limits each run to the
+    tables and views that changed.
+    '''
+    watched = {}
+    try:
+        while True:
+            changed = [
+                fname for fname in sorted(watched)
+                if file_stamp(fname) != watched[fname]]
+            if watched and not changed:
+                time.sleep(args.interval)
+                continue
+            for fname in changed:
+                LOGGER.info('%s changed', fname)
+            # taken before the run so that edits made during it count
+            stamps = dict((fname, file_stamp(fname)) for fname in watched)
+
+            start = time.time()
+            try:
+                result = cmd_qt(args)
+            except Exception: # pylint: disable=broad-except
+                LOGGER.exception('Generation failed')
+                result = -1
+            LOGGER.info('%s in %.1f ms', 'Done' if result == 0 else 'Failed',
+                        (time.time() - start) * 1000)
+
+            fnames = [args.xml] + INPUT_FILES + glob.glob(
+                os.path.join(args.templates, '*.template'))
+            for fname in fnames:
+                if fname not in stamps:
+                    stamps[fname] = file_stamp(fname)
+            watched = stamps
+    except KeyboardInterrupt:
+        pass
     return 0
 
 # ----------------------------------------------------------------------------
 
+def add_cpp_arguments(parser_a):
+    '''
+    Adds the arguments shared by the commands generating C++ sources.
+    '''
+    parser_a.add_argument(
+        'xml', metavar="XML", type=str,
+        help='input .xml file')
+    parser_a.add_argument(
+        'output', metavar="OUT", type=str, nargs='?',
+        help='output directory',
+        default='.')
+    parser_a.add_argument(
+        '--driver', type=str,
+        help='driver used for output',
+        choices=['qt'], default='qt')
+    parser_a.add_argument(
+        '--namespace', type=str,
+        help='top level namespace for generated output',
+        default='')
+    parser_a.add_argument(
+        '--templates', type=str,
+        help='directory containing file templates',
+        default='qt-templates')
+    parser_a.add_argument(
+        '--schema', type=str,
+        help='schema used for validation',
+        default=DEFAULT_SCHEMA_FILE)
+    parser_a.add_argument(
+        '--cache-dir', type=str,
+        help='directory for cached intermediate results '
+             '(empty string disables the cache)',
+        default=default_cache_dir())
+    parser_a.add_argument(
+        '--author', type=str,
+        help='The author of the files (the current user by default)',
+        default=None)
+    parser_a.add_argument(
+        '--exportm', type=str,
+        help='The macro used to export functions and classes',
+        default='')
+    parser_a.add_argument(
+        '--importh', type=str,
+        help='Header file to be imported in every generated header',
+        default='')
+    parser_a.add_argument(
+        '--jobs', '-j', type=int,
+        help='number of processes generating tables and views in '
+             'parallel (0 means one per CPU)',
+        default=1)
+    parser_a.add_argument(
+        '--reproducible', action='store_true',
+        help='leave the current date and user out of generated files; '
+             'the date is still taken from SOURCE_DATE_EPOCH if set')
+    parser_a.add_argument(
+        '--unity-chunks', type=int,
+        help='also write this many unity build sources, each including '
+             'a share of the generated .cc files, and a CMake file '
+             'listing them (0 disables)',
+        default=0)
+    parser_a.add_argument(
+        '--stream', action='store_true',
+        help='process tables and views while reading the input '
+             'instead of loading the whole file first')
+    group = parser_a.add_mutually_exclusive_group()
+    group.add_argument(
+        '--compact', action='store_true',
+        help='use memory-compact (__slots__ based) objects '
+             'for the loaded schema')
+    group.add_argument(
+        '--lazy', action='store_true',
+        help='only convert the parts of the schema that are used')
+    parser_a.add_argument(
+        '--depfile', type=str,
+        help='write a Makefile style depfile listing the files that '
+             'were read',
+        default=None)
+    parser_a.add_argument(
+        '--outputs', type=str,
+        help='write the list of generated files, one per line',
+        default=None)
+    parser_a.add_argument(
+        '--stamp', type=str,
+        help='touch this file after each successful run; it is the '
+             'first target in the depfile',
+        default=None)
+
+# ----------------------------------------------------------------------------
+
 def make_argument_parser():
     '''
     Creates an ArgumentParser to read the options for this script from
@@ -1285,13 +2851,28 @@ def make_argument_parser():
         'validate',
         help='Validate an xml against PileSchema.xsd')
     parser_a.add_argument(
-        'xml', metavar="XML", type=str,
-        help='input .xml file')
+        'xml', metavar="XML", type=str, nargs='+',
+        help='input .xml files or glob patterns')
+    parser_a.add_argument(
+        '--jobs', '-j', type=int,
+        help='number of processes validating files in parallel '
+             '(0 means one per CPU)',
+        default=0)
+    parser_a.add_argument(
+        '--summary', type=str,
+        help='write a json summary with the result and timing '
+             'for each file (- for standard output)',
+        default=None)
     parser_a.add_argument(
         '--schema', type=str,
         help='schema used for validation',
         default=DEFAULT_SCHEMA_FILE)
-    parser_a.set_defaults(func=cmd_validate)
+    parser_a.add_argument(
+        '--cache-dir', type=str,
+        help='directory for cached intermediate results '
+             '(empty string disables the cache)',
+        default=default_cache_dir())
+    parser_a.set_defaults(func=cmd_validate, lazy=True)
 
     parser_a = subparsers.add_parser(
         'sql',
@@ -1306,56 +2887,63 @@ def make_argument_parser():
         '--schema', type=str,
         help='schema used for validation',
         default=DEFAULT_SCHEMA_FILE)
+    parser_a.add_argument(
+        '--cache-dir', type=str,
+        help='directory for cached intermediate results '
+             '(empty string disables the cache)',
+        default=default_cache_dir())
     parser_a.add_argument(
         '--driver', type=str,
         help='driver used for output',
         choices=['none', 'sqlite'], default='none')
     parser_a.add_argument(
         '--author', type=str,
-        help='The author of the files',
-        default=username())
+        help='The author of the files (the current user by default)',
+        default=None)
+    parser_a.add_argument(
+        '--stream', action='store_true',
+        help='process tables and views while reading the input '
+             'instead of loading the whole file first')
+    group = parser_a.add_mutually_exclusive_group()
+    group.add_argument(
+        '--compact', action='store_true',
+        help='use memory-compact (__slots__ based) objects '
+             'for the loaded schema')
+    group.add_argument(
+        '--lazy', action='store_true',
+        help='only convert the parts of the schema that are used')
+    parser_a.add_argument(
+        '--depfile', type=str,
+        help='write a Makefile style depfile listing the files that '
+             'were read',
+        default=None)
+    parser_a.add_argument(
+        '--outputs', type=str,
+        help='write the list of generated files, one per line',
+        default=None)
+    parser_a.add_argument(
+        '--stamp', type=str,
+        help='touch this file after each successful run; it is the '
+             'first target in the depfile',
+        default=None)
     parser_a.set_defaults(func=cmd_sql)
 
     parser_a = subparsers.add_parser(
         'cpp',
         help='Generate C++ sources from input .xml')
-    parser_a.add_argument(
-        'xml', metavar="XML", type=str,
-        help='input .xml file')
-    parser_a.add_argument(
-        'output', metavar="OUT", type=str, nargs='?',
-        help='output directory',
-        default='.')
-    parser_a.add_argument(
-        '--driver', type=str,
-        help='driver used for output',
-        choices=['qt'], default='qt')
-    parser_a.add_argument(
-        '--namespace', type=str,
-        help='top level namespace for generated output',
-        default='')
-    parser_a.add_argument(
-        '--templates', type=str,
-        help='directory containing file templates',
-        default='qt-templates')
-    parser_a.add_argument(
-        '--schema', type=str,
-        help='schema used for validation',
-        default=DEFAULT_SCHEMA_FILE)
-    parser_a.add_argument(
-        '--author', type=str,
-        help='The author of the files',
-        default=username())
-    parser_a.add_argument(
-        '--exportm', type=str,
-        help='The macro used to export functions and classes',
-        default='')
-    parser_a.add_argument(
-        '--importh', type=str,
-        help='Header file to be imported in every generated header',
-        default='')
+    add_cpp_arguments(parser_a)
     parser_a.set_defaults(func=cmd_qt)
 
+    parser_a = subparsers.add_parser(
+        'watch',
+        help='Generate C++ sources and regenerate them on each change')
+    add_cpp_arguments(parser_a)
+    parser_a.add_argument(
+        '--interval', type=float,
+        help='seconds between checks for changed files',
+        default=0.5)
+    parser_a.set_defaults(func=cmd_watch)
+
     return parser
 
 # ----------------------------------------------------------------------------
@@ -1403,7 +2991,7 @@ def setup_logging(args):
 # ----------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    PARSER = make_argument_parser()
-    ARGS = PARSER.parse_args()
+    ARG_PARSER = make_argument_parser()
+    ARGS = ARG_PARSER.parse_args()
     setup_logging(ARGS)
-    ARGS.func(ARGS)
+    sys.exit(ARGS.func(ARGS) or 0)
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+'''
+Measurements for the code in pileschema.py, run on synthetic schemas.
+
+Basic usage:
+
+.. code-block:: none
+
+    pileschema_bench.py benchmark [options]
+
+'''
+
+import argparse
+from lxml import etree
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pile_schema_api
+import pile_schema_sub
+import pileschema
+
+NSPACE = 'http://pile-contributors.github.io/database/PileSchema.xsd'
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'qt-templates')
+
+# datatype elements used, in turn, for the columns of synthetic tables
+SYNTHETIC_DATATYPES = [
+    '<int/>',
+    '<varchar length="64"/>',
+    '<bit default="true"/>',
+    '<real/>',
+    '<datetime/>',
+    '<bigint/>',
+    '<text/>',
+    '<decimal precision="10" scale="2"/>',
+]
+
+# ----------------------------------------------------------------------------
+
+def synthetic_schema(table_count, column_count):
+    '''
+    Creates the text of a database with `table_count` tables, each
+    having `column_count` columns.
+    '''
+    result = [
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<database xmlns="%s" name="Synthetic">\n'
+        '  <tables>\n' % NSPACE]
+    for i in range(table_count):
+        result.append('    <table name="Table%d">\n      <columns>\n' % i)
+        result.append(
+            '        <column name="id" label="Id">'
+            '<int><identity/></int></column>\n')
+        for j in range(1, column_count):
+            result.append(
+                '        <column name="col%d" label="Column %d"%s>%s'
+                '</column>\n' % (
+                    j, j,
+                    ' foreignTable="Table0"' if j % 10 == 0 else '',
+                    SYNTHETIC_DATATYPES[j % len(SYNTHETIC_DATATYPES)]))
+        result.append('      </columns>\n    </table>\n')
+    result.append(
+        '  </tables>\n'
+        '  <views></views>\n'
+        '  <sqlPrefix></sqlPrefix>\n'
+        '  <sqlSuffix></sqlSuffix>\n'
+        '</database>\n')
+    return ''.join(result)
+
+# ----------------------------------------------------------------------------
+
+def object_size(obj, seen):
+    '''
+    The number of bytes used by `obj` and everything it references
+    that was not already counted in `seen`.
+    '''
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        children = obj
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += sys.getsizeof(obj.__dict__)
+        children = obj.__dict__.values()
+    else:
+        children = []
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                children.append(getattr(obj, name, None))
+    for child in children:
+        size += object_size(child, seen)
+    return size
+
+# ----------------------------------------------------------------------------
+
+def cmd_memory(args):
+    '''
+    Reports the memory used by the loaded object tree for each column.
+    '''
+    column_count = args.tables * args.columns
+    xmlstring = synthetic_schema(args.tables, args.columns)
+    print('%d tables, %d columns, %d bytes of xml' % (
+        args.tables, column_count, len(xmlstring)))
+
+    for label, model in (
+            ('pile_schema_api', pile_schema_api),
+            ('compact', pile_schema_sub.compact_model())):
+        database = model.parseString(xmlstring, silence=True)
+        seen = set()
+        # ignore the objects that are shared by all instances
+        for shared in (None, True, False, '', 'id', 'choose'):
+            seen.add(id(shared))
+        total = object_size(database, seen)
+        print('%-16s %10d bytes, %6.1f bytes per column' % (
+            label, total, float(total) / column_count))
+        database = None
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def best_time(func, repeat):
+    '''
+    The shortest of `repeat` runs of `func`, in seconds.
+    '''
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if result is None or elapsed < result:
+            result = elapsed
+    return result
+
+# ----------------------------------------------------------------------------
+
+def cmd_attributes(args):
+    '''
+    Compares the generated `buildAttributes` with the one installed by
+    `pile_schema_sub`, on the elements of a synthetic schema.
+    '''
+    root = etree.fromstring(synthetic_schema(args.tables, args.columns))
+    # the class of each datatype is named after the member, except for
+    # renamed ones, where it is named after the type (int, float)
+    class_names = dict(
+        (value, key) for key, value in pile_schema_sub.TAG_RENAMES.items())
+    elements = []
+    for elem in root.iter('{%s}column' % NSPACE):
+        elements.append((pile_schema_api.column, elem))
+        for child in elem:
+            member = pile_schema_sub.DATATYPE_MEMBERS[
+                etree.QName(child).localname]
+            data_type = pile_schema_api.column.member_data_items_[
+                member].get_data_type()
+            cls = getattr(
+                pile_schema_api, class_names.get(data_type, data_type))
+            elements.append((cls, child))
+    print('%d elements, %d attributes' % (
+        len(elements), sum(len(elem.attrib) for cls, elem in elements)))
+
+    def run(generated):
+        '''Builds the attributes of all elements.'''
+        for cls, elem in elements:
+            obj = cls.factory()
+            if generated:
+                cls.buildAttributes(obj, elem, elem.attrib, set())
+            else:
+                obj.buildAttributes(elem, elem.attrib, set())
+
+    generated = best_time(lambda: run(True), args.repeat)
+    fast = best_time(lambda: run(False), args.repeat)
+    for label, elapsed in (('generated', generated), ('single pass', fast)):
+        print('%-16s %8.3f s, %6.2f us per element' % (
+            label, elapsed, elapsed * 1e6 / len(elements)))
+    print('speedup %.2fx' % (generated / fast))
+    return 0
+
+# ----------------------------------------------------------------------------
+
+class DiscardingQtDriver(pileschema.QtDriver):
+    '''
+    A QtDriver that renders the templates but does not save the result.
+    '''
+    def write_output(self, fname, content):
+        '''Counts the file without saving it'''
+        self.written += 1
+
+# ----------------------------------------------------------------------------
+
+def scaling_sizes(limit):
+    '''
+    The sizes to measure: `limit` halved until it gets below 1000.
+    '''
+    result = [limit]
+    while result[0] >= 2000:
+        result.insert(0, result[0] // 2)
+    return result
+
+# ----------------------------------------------------------------------------
+
+def time_drivers(table_count, column_count, repeat,
+                 template_dir=TEMPLATE_DIR):
+    '''
+    The time taken by the sql and the cpp driver to process a synthetic
+    database, parsing excluded.
+    '''
+    database = pileschema.MODEL.parseString(
+        synthetic_schema(table_count, column_count), silence=True)
+    out_dir = tempfile.mkdtemp()
+    try:
+        result = []
+        for make_driver in (
+                pileschema.SqLiteDriver,
+                lambda: DiscardingQtDriver(out_dir, template_dir)):
+            result.append(best_time(
+                lambda: pileschema.process_with_driver(
+                    make_driver(), database), repeat))
+    finally:
+        shutil.rmtree(out_dir)
+    return result
+
+# ----------------------------------------------------------------------------
+
+def cmd_scaling(args):
+    '''
+    Shows how the time taken to generate the output grows with the
+    number of columns in a table and with the number of tables.
+
+    The time per column or per table stays flat when the generators
+    are linear.
+    '''
+    pileschema.AUTHOR = 'bench'
+    print('%-28s %10s %10s %12s %12s' % (
+        'schema', 'sql (s)', 'cpp (s)', 'sql/unit us', 'cpp/unit us'))
+    for label, count, shape in (
+            ('columns', args.columns, lambda n: (1, n)),
+            ('tables', args.tables,
+             lambda n: (n, args.columns_per_table))):
+        for size in scaling_sizes(count):
+            table_count, column_count = shape(size)
+            sql, cpp = time_drivers(
+                table_count, column_count, args.repeat, args.templates)
+            print('%-28s %10.3f %10.3f %12.2f %12.2f' % (
+                '%d x %d (%s)' % (table_count, column_count, label),
+                sql, cpp, sql * 1e6 / size, cpp * 1e6 / size))
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def cmd_templates(args):
+    '''
+    Compares rendering the text of the templates with the % operator
+    to rendering their compiled form, using the variables of a table,
+    and shows the cost of getting the compiled form.
+    '''
+    pileschema.AUTHOR = 'bench'
+    database = pileschema.MODEL.parseString(
+        synthetic_schema(1, args.columns), silence=True)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        driver = DiscardingQtDriver(cache_dir, TEMPLATE_DIR)
+        pileschema.process_with_driver(driver, database)
+        # variables of the table are only computed when looked up
+        lazy_data = driver.data
+        data = dict(lazy_data)
+
+        names = sorted(
+            name for name in os.listdir(TEMPLATE_DIR)
+            if name.endswith('.template'))
+        fnames = [os.path.join(TEMPLATE_DIR, name) for name in names]
+        texts = []
+        for fname in fnames:
+            with open(fname, 'r') as finp:
+                texts.append(finp.read())
+        compiled = [pileschema.compile_template(text) for text in texts]
+        # view templates use variables that only views define
+        for template in compiled:
+            for _, key in template.slots:
+                if key not in data:
+                    try:
+                        data[key] = lazy_data[key]
+                    except KeyError:
+                        data[key] = ''
+
+        def render(templates):
+            '''Renders all templates `args.count` times.'''
+            for _ in range(args.count):
+                for template in templates:
+                    template % data
+
+        def load(clear):
+            '''Loads all templates, from the disk cache if `clear`.'''
+            if clear:
+                pileschema.COMPILED_TEMPLATES.clear()
+            for fname in fnames:
+                pileschema.load_template(fname, cache_dir)
+
+        load(True)
+        renders = len(names) * args.count
+        print('%d templates, %d variables, %d renders' % (
+            len(names), len(data), renders))
+        for label, elapsed in (
+                ('% operator', best_time(lambda: render(texts), args.repeat)),
+                ('compiled', best_time(
+                    lambda: render(compiled), args.repeat))):
+            print('%-16s %8.3f s, %8.2f us per render' % (
+                label, elapsed, elapsed * 1e6 / renders))
+        for label, elapsed in (
+                ('compile', best_time(
+                    lambda: [pileschema.compile_template(text)
+                             for text in texts], args.repeat)),
+                ('disk cache', best_time(lambda: load(True), args.repeat)),
+                ('in process', best_time(
+                    lambda: load(False), args.repeat))):
+            print('%-16s %8.3f s, %8.2f us per template' % (
+                label, elapsed, elapsed * 1e6 / len(names)))
+    finally:
+        shutil.rmtree(cache_dir)
+    return 0
+
+# ----------------------------------------------------------------------------
+
+def make_argument_parser():
+    '''
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    '''
+    parser = argparse.ArgumentParser(
+        description="Measurements for pileschema module.",
+        epilog='\n'.join(__doc__.strip().split('\n')[1:]).strip(),
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    subparsers = parser.add_subparsers(help='Available benchmarks')
+
+    parser_a = subparsers.add_parser(
+        'memory',
+        help='Memory used by the loaded schema, per column')
+    parser_a.add_argument(
+        '--tables', type=int,
+        help='number of tables in the synthetic schema',
+        default=100)
+    parser_a.add_argument(
+        '--columns', type=int,
+        help='number of columns in each table',
+        default=1000)
+    parser_a.set_defaults(func=cmd_memory)
+
+    parser_a = subparsers.add_parser(
+        'attributes',
+        help='Time taken to bind xml attributes to members')
+    parser_a.add_argument(
+        '--tables', type=int,
+        help='number of tables in the synthetic schema',
+        default=10)
+    parser_a.add_argument(
+        '--columns', type=int,
+        help='number of columns in each table',
+        default=1000)
+    parser_a.add_argument(
+        '--repeat', type=int,
+        help='number of runs; the fastest is reported',
+        default=5)
+    parser_a.set_defaults(func=cmd_attributes)
+
+    parser_a = subparsers.add_parser(
+        'scaling',
+        help='Generation time as tables and columns are added')
+    parser_a.add_argument(
+        '--columns', type=int,
+        help='largest number of columns in a single table',
+        default=10000)
+    parser_a.add_argument(
+        '--tables', type=int,
+        help='largest number of tables in the database',
+        default=10000)
+    parser_a.add_argument(
+        '--columns-per-table', type=int,
+        help='number of columns in each table when adding tables',
+        default=4)
+    parser_a.add_argument(
+        '--templates', type=str,
+        help='directory containing the templates rendered by the cpp driver',
+        default=TEMPLATE_DIR)
+    parser_a.add_argument(
+        '--repeat', type=int,
+        help='number of runs; the fastest is reported',
+        default=1)
+    parser_a.set_defaults(func=cmd_scaling)
+
+    parser_a = subparsers.add_parser(
+        'templates',
+        help='Time taken to render the templates')
+    parser_a.add_argument(
+        '--columns', type=int,
+        help='number of columns in the table providing the variables',
+        default=20)
+    parser_a.add_argument(
+        '--count', type=int,
+        help='number of times each template is rendered',
+        default=1000)
+    parser_a.add_argument(
+        '--repeat', type=int,
+        help='number of runs; the fastest is reported',
+        default=5)
+    parser_a.set_defaults(func=cmd_templates)
+
+    return parser
+
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    ARG_PARSER = make_argument_parser()
+    ARGS = ARG_PARSER.parse_args()
+    sys.exit(ARGS.func(ARGS))
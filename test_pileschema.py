@@ -0,0 +1,850 @@
+#!/usr/bin/env python
+'''
+Tests for the code generator.
+
+The generator is run the way a build runs it (as a separate process)
+and the files it writes are compared.
+
+.. code-block:: none
+
+    python -m unittest test_pileschema
+
+'''
+
+import glob
+import inspect
+import json
+import keyword
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import warnings
+
+from lxml import etree
+
+import pile_schema_api
+import pile_schema_sub
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'pileschema.py')
+SCHEMA = os.path.join(HERE, 'PileSchema.xsd')
+
+SHOP_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<database xmlns="http://pile-contributors.github.io/database/PileSchema.xsd"
+          name="Shop" driver="sqlite">
+  <tables>
+    <table name="Category">
+      <columns>
+        <column name="id" label="Id"><int><identity/></int></column>
+        <column name="name" label="Name">
+          <varchar length="64" default="none"/></column>
+      </columns>
+      <primaryKey><key name="pk_cat"><column name="id"/></key></primaryKey>
+    </table>
+    <table name="Product">
+      <columns>
+        <column name="id" label="Id"><int><identity/></int></column>
+        <column name="title" allowNulls="false">
+          <varchar length="128"/></column>
+        <column name="price"><real default="0"/></column>
+        <column name="active"><bit default="true"/></column>
+        <column name="category" foreignTable="Category"
+                foreignColumn="id" foreignInsert="id"><int/></column>
+        <column name="catname" label="Category name" foreignInsert="name">
+          <vrtcol references="category"/></column>
+      </columns>
+      <primaryKey><key name="pk_prod"><column name="id"/></key></primaryKey>
+    </table>
+  </tables>
+  <views>
+    <view name="ActiveProducts">
+      <subset name1="Product" col1="active" constraint="=" value="1"/>
+      <writeback table="Product">
+        <column name="active" value="true"/></writeback>
+    </view>
+    <view name="CheapProducts">
+      <subset name1="Product" col1="price" constraint="&lt;" value="10"/>
+    </view>
+  </views>
+  <sqlPrefix>BEGIN;
+</sqlPrefix>
+  <sqlSuffix>COMMIT;
+</sqlSuffix>
+</database>
+'''
+
+
+# ----------------------------------------------------------------------------
+def read_file(path):
+    '''The content of a file, empty if it does not exist'''
+    try:
+        with open(path, 'rb') as fhandle:
+            return fhandle.read()
+    except IOError:
+        return b''
+
+# ----------------------------------------------------------------------------
+def read_tree(path):
+    '''Returns the content of all files in a directory by relative path'''
+    result = {}
+    for root, _, files in os.walk(path):
+        for fname in files:
+            fpath = os.path.join(root, fname)
+            with open(fpath, 'rb') as fhandle:
+                result[os.path.relpath(fpath, path)] = fhandle.read()
+    return result
+
+# A value of each type of xml attribute, for `TestFastAttributes`.
+SAMPLE_VALUES = {
+    'xs:string': 'text',
+    'xs:boolean': 'true',
+    'xs:byte': '7',
+    'xs:short': '7',
+    'xs:int': '7',
+    'xs:integer': '7',
+    'xs:long': '7',
+    'xs:unsignedShort': '7',
+    'xs:decimal': '2.5',
+    'xs:date': '2015-06-01',
+    'xs:time': '12:30:00',
+    'tristateValues': 'undefined',
+    'GUID': '{01234567-89ab-cdef-0123-456789abcdef}',
+    'charLength': 'max',
+    'ncharLength': '10',
+    'sortOrder': 'Descending',
+    # out of range, so the warning of the validator is compared too
+    'mantissaBits': '99',
+    'fractionalSecondsPrecision': '3',
+    'moneydefault': '1.25',
+    'smallmoneyDefault': '1.25',
+}
+
+
+# ----------------------------------------------------------------------------
+def member_names(node):
+    '''The names of the members of an object of the model'''
+    # members named like a keyword get an underscore (`in_`)
+    return [name + '_' if keyword.iskeyword(name) else name
+            for name in sorted(type(node).member_data_items_)]
+
+# ----------------------------------------------------------------------------
+def model_objects(node):
+    '''All objects of the model reachable from `node`, `node` included'''
+    result = [node]
+    for name in member_names(node):
+        value = getattr(node, name)
+        for item in value if isinstance(value, list) else [value]:
+            if hasattr(item, 'member_data_items_'):
+                result.extend(model_objects(item))
+    return result
+
+# ----------------------------------------------------------------------------
+def build_database(model, content):
+    '''Builds the objects of `model` for an xml document'''
+    xml_node = etree.fromstring(content.encode('utf-8'))
+    _, root_class = model.get_root_tag(xml_node)
+    return root_class.factory().build(xml_node)
+
+# ----------------------------------------------------------------------------
+def qt_sql_flags():
+    '''The compiler flags for the Qt Sql module, None if it is not installed'''
+    for module in ('Qt5Sql', 'Qt6Sql'):
+        try:
+            with open(os.devnull, 'w') as devnull:
+                output = subprocess.check_output(
+                    ['pkg-config', '--cflags', '--libs', module],
+                    stderr=devnull)
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        return output.split()
+    return None
+
+# ----------------------------------------------------------------------------
+class GeneratorTestCase(unittest.TestCase):
+    '''Runs the generator in a temporary directory'''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='pileschema-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_input(self, content, name='input.xml'):
+        '''Writes an input file and returns its path'''
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as fhandle:
+            fhandle.write(content)
+        return path
+
+    def run_script(self, args, env=None):
+        '''Runs pileschema.py; returns its exit status and output'''
+        process = subprocess.Popen(
+            [sys.executable, SCRIPT] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        output = process.communicate()[0]
+        return process.returncode, output
+
+    def generate(self, xml_file, out_name, args=(), env=None):
+        '''Generates C++ sources and returns the files that were written'''
+        out_dir = os.path.join(self.tmp_dir, out_name)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        status, output = self.run_script(
+            ['cpp', xml_file, out_dir, '--author', 'test',
+             '--cache-dir', ''] + list(args), env)
+        self.assertEqual(status, 0, output)
+        return read_tree(out_dir)
+
+    def generate_sql(self, xml_file, out_name, args=()):
+        '''Generates the SQL file and returns its content'''
+        sql_file = os.path.join(self.tmp_dir, out_name)
+        status, output = self.run_script(
+            ['sql', xml_file, sql_file, '--author', 'test',
+             '--cache-dir', ''] + list(args))
+        self.assertEqual(status, 0, output)
+        return read_file(sql_file)
+
+    def qt_build_args(self):
+        '''
+        The compiler arguments for building the library and the generated
+        sources against the Qt Sql module; skips the test without it
+        '''
+        flags = qt_sql_flags()
+        if flags is None:
+            self.skipTest('the Qt Sql module is not installed')
+        include_dir = os.path.join(self.tmp_dir, 'include', 'dbstruct')
+        os.makedirs(include_dir)
+        for fname in glob.glob(os.path.join(HERE, '*.h')):
+            shutil.copy(fname, include_dir)
+        shutil.copy(os.path.join(HERE, 'dbtaew.h'),
+                    os.path.join(include_dir, 'DbTaew.h'))
+        # the dbstruct-config.h CMake would write for a static build
+        content = read_file(os.path.join(HERE, 'dbstruct-config.h.in'))
+        content = re.sub(r'#cmakedefine (Qt5Core_FOUND|DBSTRUCT_STATIC)\b',
+                         r'#define \1', content)
+        content = re.sub(r'#cmakedefine (\w+)', r'/* #undef \1 */', content)
+        content = re.sub(r'@[A-Z_]+@', '0', content)
+        with open(os.path.join(include_dir, 'dbstruct-config.h'), 'w') as fout:
+            fout.write(content)
+        return ['-std=c++17', '-fPIC', '-I' + os.path.dirname(include_dir),
+                '-I' + include_dir] + flags
+
+    def assertSameTree(self, first, second):
+        '''Both runs wrote the same files with the same content'''
+        self.assertEqual(sorted(first), sorted(second))
+        for fname in first:
+            self.assertEqual(first[fname], second[fname],
+                             '%s differs' % fname)
+
+# ----------------------------------------------------------------------------
+class TestCpp(GeneratorTestCase):
+    '''The C++ sources do not depend on how they were produced'''
+
+    def test_jobs_same_as_serial(self):
+        xml_file = self.write_input(SHOP_XML)
+        serial = self.generate(xml_file, 'serial', ['--jobs', '1'])
+        parallel = self.generate(xml_file, 'parallel', ['--jobs', '3'])
+        self.assertTrue(serial)
+        self.assertSameTree(serial, parallel)
+
+    def test_incremental_same_as_fresh(self):
+        xml_file = self.write_input(SHOP_XML)
+        self.generate(xml_file, 'incremental')
+        changed = SHOP_XML.replace(
+            '''<subset name1="Product" col1="price" constraint="&lt;" \
+value="10"/>
+''', '''<subset name1="Product" col1="price" constraint="&lt;" \
+value="5"/>
+      <writeback table="Product">
+        <column name="price" value="1"/></writeback>
+''')
+        self.assertNotEqual(changed, SHOP_XML)
+        xml_file = self.write_input(changed)
+        incremental = self.generate(xml_file, 'incremental')
+        fresh = self.generate(xml_file, 'fresh')
+        self.assertSameTree(incremental, fresh)
+
+    def test_same_for_any_hash_seed(self):
+        xml_file = self.write_input(SHOP_XML)
+        outputs = []
+        for seed in ('1', '2'):
+            env = dict(os.environ)
+            env['PYTHONHASHSEED'] = seed
+            outputs.append(self.generate(xml_file, 'seed' + seed, env=env))
+        self.assertSameTree(outputs[0], outputs[1])
+
+    def test_templates_in_non_ascii_directory(self):
+        xml_file = self.write_input(SHOP_XML)
+        template_dir = os.path.join(self.tmp_dir, 'mod\xc3\xa8les')
+        shutil.copytree(os.path.join(HERE, 'qt-templates'), template_dir)
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        output = self.generate(
+            xml_file, 'default', ['--cache-dir', cache_dir])
+        moved = self.generate(
+            xml_file, 'moved',
+            ['--cache-dir', cache_dir, '--templates', template_dir])
+        self.assertSameTree(output, moved)
+
+    def rewritten(self, xml_file, out_dir):
+        '''
+        Generates C++ sources over earlier ones; returns the files that
+        were written again and the log
+        '''
+        for fname in os.listdir(out_dir):
+            # any file written from now on has a different time
+            os.utime(os.path.join(out_dir, fname), (1000000000, 1000000000))
+        status, output = self.run_script(
+            ['cpp', xml_file, out_dir, '--author', 'test', '--cache-dir', ''])
+        self.assertEqual(status, 0, output)
+        return sorted(
+            fname for fname in os.listdir(out_dir)
+            if os.path.getmtime(os.path.join(out_dir, fname)) != 1000000000
+        ), output
+
+    def test_second_run_writes_nothing(self):
+        xml_file = self.write_input(SHOP_XML)
+        files = self.generate(xml_file, 'out')
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        rewritten, output = self.rewritten(xml_file, out_dir)
+        self.assertEqual(rewritten, [])
+        # the manifest is not counted
+        self.assertIn('0 files written, %d unchanged' % (len(files) - 1),
+                      output)
+        self.assertSameTree(files, read_tree(out_dir))
+
+    def test_changed_table_rewrites_its_files(self):
+        xml_file = self.write_input(SHOP_XML)
+        self.generate(xml_file, 'out')
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        xml_file = self.write_input(SHOP_XML.replace(
+            '<varchar length="64"', '<varchar length="32"'))
+        rewritten, output = self.rewritten(xml_file, out_dir)
+        self.assertIn('.pileschema-manifest.json', rewritten)
+        rewritten.remove('.pileschema-manifest.json')
+        self.assertTrue(rewritten, output)
+        for fname in rewritten:
+            self.assertTrue(fname.startswith('category'), fname)
+        self.assertIn('%d files written' % len(rewritten), output)
+        self.assertSameTree(read_tree(out_dir),
+                            self.generate(xml_file, 'fresh'))
+
+    def test_build_info(self):
+        xml_file = self.write_input(SHOP_XML)
+        depfile = os.path.join(self.tmp_dir, 'shop.d')
+        outputs = os.path.join(self.tmp_dir, 'shop.outputs')
+        stamp = os.path.join(self.tmp_dir, 'shop.stamp')
+        files = self.generate(xml_file, 'out', [
+            '--depfile', depfile, '--outputs', outputs, '--stamp', stamp])
+        self.assertTrue(os.path.isfile(stamp))
+        with open(outputs) as finp:
+            listed = finp.read().splitlines()
+        self.assertEqual(
+            sorted(os.path.relpath(fname, os.path.join(self.tmp_dir, 'out'))
+                   for fname in listed),
+            sorted(fname for fname in files if not fname.startswith('.')))
+        with open(depfile) as finp:
+            targets, inputs = finp.read().split(':', 1)
+        self.assertEqual(targets.split()[0], stamp)
+        self.assertIn(xml_file, inputs)
+
+# ----------------------------------------------------------------------------
+class TestUnity(GeneratorTestCase):
+    '''The unity build sources include each generated source once'''
+
+    def cmake_list(self, content, name):
+        '''The file names in a variable of the -sources.cmake file'''
+        block = re.search(
+            r'set\(%s\n(.*?)\)' % name, content, re.DOTALL).group(1)
+        return re.findall(r'"\$\{CMAKE_CURRENT_LIST_DIR\}/([^"]+)"', block)
+
+    def test_chunks(self):
+        xml_file = self.write_input(SHOP_XML)
+        for chunks in (4, 1, 2, 100):
+            # the same directory, so stale chunks must go
+            files = self.generate(
+                xml_file, 'out', ['--unity-chunks', str(chunks)])
+            unity = sorted(fname for fname in files if '-unity-' in fname)
+            sources = sorted(
+                fname for fname in files
+                if fname.endswith('.cc') and fname not in unity)
+            self.assertEqual(len(unity), min(chunks, len(sources)))
+            self.assertEqual(
+                unity, ['shop-unity-%d.cc' % (index + 1)
+                        for index in range(len(unity))])
+
+            included = []
+            sizes = []
+            for fname in unity:
+                names = re.findall(r'#include "([^"]+)"', files[fname])
+                included.extend(names)
+                sizes.append(len(names))
+            self.assertEqual(sorted(included), sources)
+            self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+            cmake = files['shop-sources.cmake']
+            self.assertEqual(self.cmake_list(cmake, 'SHOP_SOURCES'), unity)
+            self.assertEqual(
+                sorted(self.cmake_list(cmake, 'SHOP_HEADERS')),
+                sorted(fname for fname in files if fname.endswith('.h')))
+
+    def test_build(self):
+        build_args = self.qt_build_args()
+        xml_file = self.write_input(SHOP_XML)
+        # all sources in one translation unit
+        files = self.generate(xml_file, 'out', [
+            '--unity-chunks', '1', '--namespace', 'test',
+            '--importh', 'dbstruct/dbstruct-config.h'])
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        process = subprocess.Popen(
+            ['c++', '-fsyntax-only', '-I' + out_dir,
+             os.path.join(out_dir, 'shop-unity-1.cc')] + build_args,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+        self.assertIn('shop-unity-1.cc', files)
+
+# ----------------------------------------------------------------------------
+class TestCache(GeneratorTestCase):
+    '''Output replayed from the parse cache is the output of a fresh parse'''
+
+    def setUp(self):
+        GeneratorTestCase.setUp(self)
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+
+    def run_both(self, xml_file, out_name, cache_dir, schema=SCHEMA):
+        '''
+        Generates SQL and C++ sources; returns the exit status of each run,
+        the files that were written (the SQL one as `sql`) and the log
+        '''
+        out_dir = os.path.join(self.tmp_dir, out_name)
+        os.makedirs(out_dir)
+        sql_file = os.path.join(self.tmp_dir, out_name + '.sql')
+        statuses = []
+        log = b''
+        for args in (['cpp', xml_file, out_dir],
+                     ['sql', xml_file, sql_file]):
+            status, output = self.run_script(
+                ['--debug'] + args + ['--author', 'test', '--schema', schema,
+                                      '--cache-dir', cache_dir])
+            statuses.append(status)
+            log += output
+        files = read_tree(out_dir)
+        files['sql'] = read_file(sql_file)
+        return statuses, files, log
+
+    def test_replay_same_as_fresh(self):
+        xml_file = self.write_input(SHOP_XML)
+        _, fresh, _ = self.run_both(xml_file, 'fresh', '')
+        _, first, log = self.run_both(xml_file, 'first', self.cache_dir)
+        self.assertEqual(log.count(b'Using cached content'), 1, log)
+        statuses, replayed, log = self.run_both(
+            xml_file, 'replayed', self.cache_dir)
+        self.assertEqual(statuses, [0, 0], log)
+        self.assertEqual(log.count(b'Using cached content'), 2, log)
+        self.assertTrue(fresh['sql'])
+        self.assertSameTree(fresh, first)
+        self.assertSameTree(fresh, replayed)
+
+    def test_input_change(self):
+        xml_file = self.write_input(SHOP_XML)
+        self.run_both(xml_file, 'before', self.cache_dir)
+        xml_file = self.write_input(SHOP_XML.replace(
+            'constraint="&lt;" value="10"', 'constraint="&lt;" value="5"'))
+        statuses, cached, log = self.run_both(
+            xml_file, 'cached', self.cache_dir)
+        self.assertEqual(statuses, [0, 0], log)
+        # only the sql run uses what the cpp run parsed
+        self.assertEqual(log.count(b'Using cached content'), 1, log)
+        _, fresh, _ = self.run_both(xml_file, 'fresh', '')
+        self.assertIn(b'price<5', fresh['sql'])
+        self.assertSameTree(fresh, cached)
+
+    def test_schema_change(self):
+        xml_file = self.write_input(SHOP_XML)
+        schema = os.path.join(self.tmp_dir, 'schema.xsd')
+        shutil.copy(SCHEMA, schema)
+        statuses, _, log = self.run_both(
+            xml_file, 'before', self.cache_dir, schema)
+        self.assertEqual(statuses, [0, 0], log)
+        # sqlSuffix is no longer allowed, so the input is invalid
+        with open(schema, 'wb') as fhandle:
+            fhandle.write(read_file(SCHEMA).replace(
+                b'name="sqlSuffix"', b'name="sqlSuffixToo"'))
+        statuses, _, log = self.run_both(
+            xml_file, 'after', self.cache_dir, schema)
+        self.assertNotIn(0, statuses, log)
+        self.assertNotIn(b'Using cached content', log)
+
+# ----------------------------------------------------------------------------
+class TestStream(GeneratorTestCase):
+    '''Streaming the input changes how it is read, not the output'''
+
+    def test_same_as_default(self):
+        xml_file = self.write_input(SHOP_XML)
+        sql = self.generate_sql(xml_file, 'default.sql')
+        self.assertTrue(sql)
+        self.assertEqual(
+            sql, self.generate_sql(xml_file, 'stream.sql', ['--stream']))
+        self.assertSameTree(
+            self.generate(xml_file, 'default'),
+            self.generate(xml_file, 'stream', ['--stream']))
+
+    def test_invalid_input(self):
+        # the error is in the last table, after the others were read
+        xml_file = self.write_input(SHOP_XML.replace(
+            '<column name="catname"', '<column name="catname" size="1"'))
+        sql_file = os.path.join(self.tmp_dir, 'out.sql')
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        os.makedirs(out_dir)
+        for args in (['sql', xml_file, sql_file],
+                     ['cpp', xml_file, out_dir]):
+            status, output = self.run_script(
+                args + ['--stream', '--cache-dir', ''])
+            self.assertNotEqual(status, 0, output)
+            self.assertIn('Schema validation failed', output)
+        self.assertFalse(os.path.exists(sql_file))
+        self.assertEqual(os.listdir(out_dir), [])
+
+# ----------------------------------------------------------------------------
+class TestModels(GeneratorTestCase):
+    '''The flavours of the object model produce the same output'''
+
+    def test_compact_output(self):
+        xml_file = self.write_input(SHOP_XML)
+        self.assertEqual(
+            self.generate_sql(xml_file, 'default.sql'),
+            self.generate_sql(xml_file, 'compact.sql', ['--compact']))
+        self.assertSameTree(
+            self.generate(xml_file, 'default'),
+            self.generate(xml_file, 'compact', ['--compact']))
+
+    def test_compact_objects(self):
+        objects = model_objects(
+            build_database(pile_schema_sub.compact_model(), SHOP_XML))
+        self.assertEqual(
+            len(objects),
+            len(model_objects(build_database(pile_schema_api, SHOP_XML))))
+        for obj in objects:
+            self.assertTrue(hasattr(type(obj), '__slots__'), type(obj))
+            self.assertFalse(hasattr(obj, '__dict__'), type(obj))
+
+    def assertSameObjects(self, first, second):
+        '''Both objects, and the objects below them, hold the same values'''
+        self.assertEqual(member_names(first), member_names(second))
+        for name in member_names(first):
+            values = getattr(first, name), getattr(second, name)
+            if isinstance(values[0], list):
+                self.assertEqual(len(values[0]), len(values[1]), name)
+                pairs = zip(*values)
+            else:
+                pairs = [values]
+            for item, other in pairs:
+                if hasattr(item, 'member_data_items_'):
+                    self.assertSameObjects(item, other)
+                else:
+                    self.assertEqual(item, other, name)
+
+    def test_lazy_output(self):
+        xml_file = self.write_input(SHOP_XML)
+        self.assertEqual(
+            self.generate_sql(xml_file, 'default.sql'),
+            self.generate_sql(xml_file, 'lazy.sql', ['--lazy']))
+        self.assertSameTree(
+            self.generate(xml_file, 'default'),
+            self.generate(xml_file, 'lazy', ['--lazy']))
+
+    def test_lazy_objects(self):
+        eager = build_database(pile_schema_api, SHOP_XML)
+        lazy = build_database(pile_schema_sub.lazy_model(), SHOP_XML)
+        self.assertIn('lazy_node_', vars(lazy))
+
+        # reading a member resolves that object only
+        self.assertEqual(lazy.name, 'Shop')
+        self.assertNotIn('lazy_node_', vars(lazy))
+        self.assertIn('lazy_node_', vars(lazy.tables))
+        self.assertIn('lazy_node_', vars(lazy.views))
+
+        # a child, its attributes and its own children are read later
+        product = lazy.tables.table[1]
+        self.assertIn('lazy_node_', vars(product))
+        self.assertSameObjects(product, eager.tables.table[1])
+
+        self.assertSameObjects(lazy, eager)
+        for obj in model_objects(lazy):
+            self.assertNotIn('lazy_node_', vars(obj), type(obj))
+
+# ----------------------------------------------------------------------------
+class TestFastAttributes(unittest.TestCase):
+    '''
+    The single pass `buildAttributes` of pile_schema_sub sets the same
+    members as the one generated for each class
+    '''
+
+    def build(self, cls, build_attributes, attrs):
+        '''The members and warnings of an object built from `attrs`'''
+        node = etree.Element('sample', attrs)
+        obj = cls.subclass()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            build_attributes(obj, node, node.attrib, set())
+        return (dict((name, getattr(obj, name)) for name in member_names(obj)),
+                [str(warning.message) for warning in caught])
+
+    def test_same_as_generated(self):
+        tested = []
+        for name in pile_schema_api.__all__:
+            cls = getattr(pile_schema_api, name)
+            if cls.subclass is None or \
+                    'buildAttributes' not in vars(cls.subclass):
+                continue
+            # the attributes read by the generated code
+            names = re.findall(r"find_attr_value_\('([^']+)', node\)",
+                               inspect.getsource(cls.buildAttributes))
+            every = dict(
+                (attr, SAMPLE_VALUES[
+                    cls.member_data_items_[attr].get_data_type()])
+                for attr in names)
+            # none, every other one (the rest keep their defaults) and all
+            for attrs in ({}, dict(
+                    (attr, every[attr]) for attr in sorted(every)[::2]),
+                          every):
+                self.assertEqual(
+                    self.build(cls, cls.buildAttributes, attrs),
+                    self.build(cls, cls.subclass.buildAttributes, attrs),
+                    '%s %s' % (name, sorted(attrs)))
+            tested.append(name)
+        self.assertIn('column', tested)
+        self.assertIn('database', tested)
+
+# ----------------------------------------------------------------------------
+class TestValidate(GeneratorTestCase):
+    '''Validating many files at once gives a result for each of them'''
+
+    def summary(self, files, jobs):
+        '''Validates `files`; returns the exit status and the summary'''
+        summary_file = os.path.join(self.tmp_dir, 'summary-%d.json' % jobs)
+        status, output = self.run_script(
+            ['validate'] + files + ['--jobs', str(jobs), '--cache-dir', '',
+                                    '--summary', summary_file])
+        with open(summary_file) as finp:
+            return status, json.load(finp)
+
+    def test_parallel_summary(self):
+        inputs = [
+            ('valid', SHOP_XML, True),
+            ('no-prefix', SHOP_XML.replace('<sqlPrefix>', '<x>'), False),
+            ('not-xml', SHOP_XML.replace('</tables>', ''), False),
+            ('store', SHOP_XML.replace('"Shop"', '"Store"'), True),
+            ('bad-attribute', SHOP_XML.replace(
+                '<column name="catname"', '<column name="catname" size="1"'),
+             False),
+            ('group', SHOP_XML.replace('Category', 'Group'), True),
+        ]
+        files = [self.write_input(content, name + '.xml')
+                 for name, content, _ in inputs]
+        status, summary = self.summary(files, 3)
+        self.assertNotEqual(status, 0)
+        self.assertEqual(summary['jobs'], 3)
+        self.assertEqual((summary['passed'], summary['failed']), (3, 3))
+        self.assertEqual([result['file'] for result in summary['files']],
+                         files)
+        for (name, _, valid), result in zip(inputs, summary['files']):
+            self.assertEqual(result['valid'], valid, name)
+            self.assertEqual(bool(result['errors']), not valid, name)
+        self.assertIn('size', ''.join(summary['files'][4]['errors']))
+
+        # the same results as one file after the other
+        _, serial = self.summary(files, 1)
+        for result in summary['files'] + serial['files']:
+            del result['seconds']
+        self.assertEqual(summary['files'], serial['files'])
+
+# ----------------------------------------------------------------------------
+class TestExitStatus(GeneratorTestCase):
+    '''Failures are reported to the caller (make, cmake, a shell)'''
+
+    def test_valid_input(self):
+        xml_file = self.write_input(SHOP_XML)
+        for command in ('validate', 'sql'):
+            status, output = self.run_script(
+                [command, xml_file, '--cache-dir', ''])
+            self.assertEqual(status, 0, output)
+
+    def test_invalid_input(self):
+        xml_file = self.write_input(SHOP_XML.replace('<sqlPrefix>', '<x>'))
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        os.makedirs(out_dir)
+        for args in (['validate', xml_file], ['sql', xml_file],
+                     ['cpp', xml_file, out_dir]):
+            status, output = self.run_script(args + ['--cache-dir', ''])
+            self.assertNotEqual(status, 0, output)
+
+    def test_well_formed_but_not_valid(self):
+        content = SHOP_XML.replace(
+            '<column name="catname"', '<column name="catname" size="1"')
+        # only the schema rejects it
+        etree.fromstring(content.encode('utf-8'))
+        line = content[:content.index('size="1"')].count('\n') + 1
+        xml_file = self.write_input(content)
+        sql_file = os.path.join(self.tmp_dir, 'out.sql')
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        os.makedirs(out_dir)
+        for args in (['validate', xml_file], ['sql', xml_file, sql_file],
+                     ['cpp', xml_file, out_dir]):
+            status, output = self.run_script(args + ['--cache-dir', ''])
+            self.assertNotEqual(status, 0, output)
+            self.assertIn('Schema validation failed', output)
+            self.assertIn("attribute 'size': The attribute 'size' is not "
+                          "allowed. (line %d)" % line, output)
+        self.assertFalse(os.path.exists(sql_file))
+        self.assertEqual(os.listdir(out_dir), [])
+
+    def test_include_without_href(self):
+        xml_file = self.write_input(SHOP_XML.replace(
+            '<tables>', '<tables>\n    <xi:include/>').replace(
+                'name="Shop"',
+                'xmlns:xi="http://www.w3.org/2001/XInclude" name="Shop"'))
+        status, output = self.run_script(
+            ['sql', xml_file, '--cache-dir', ''])
+        self.assertNotEqual(status, 0, output)
+        self.assertIn('%s:5: include without href' % xml_file, output)
+
+# ----------------------------------------------------------------------------
+class TestWatch(GeneratorTestCase):
+    '''The watch command follows changes to its inputs'''
+
+    def wait_for_log(self, log_file, text, count):
+        '''Waits until `text` was logged `count` times'''
+        deadline = time.time() + 30
+        while read_file(log_file).count(text) < count:
+            self.assertLess(time.time(), deadline, read_file(log_file))
+            time.sleep(0.05)
+
+    def test_schema_edit(self):
+        xml_file = self.write_input(SHOP_XML)
+        schema = os.path.join(self.tmp_dir, 'schema.xsd')
+        shutil.copy(SCHEMA, schema)
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        os.makedirs(out_dir)
+        log_file = os.path.join(self.tmp_dir, 'watch.log')
+        process = subprocess.Popen(
+            [sys.executable, SCRIPT, '--logfile', log_file, 'watch',
+             xml_file, out_dir, '--schema', schema, '--interval', '0.05',
+             '--cache-dir', os.path.join(self.tmp_dir, 'cache')],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            self.wait_for_log(log_file, 'Done in', 1)
+            # sqlSuffix is no longer allowed, so the input is invalid
+            content = read_file(schema).replace(
+                b'name="sqlSuffix"', b'name="sqlSuffixToo"')
+            with open(schema, 'wb') as fhandle:
+                fhandle.write(content)
+            self.wait_for_log(log_file, 'Failed in', 1)
+            with open(schema, 'wb') as fhandle:
+                fhandle.write(read_file(SCHEMA))
+            self.wait_for_log(log_file, 'Done in', 2)
+        finally:
+            process.terminate()
+            process.communicate()
+
+# ----------------------------------------------------------------------------
+SAVE_MANY_CC = '''
+#include <QCoreApplication>
+#include <QSqlDatabase>
+#include <QSqlQuery>
+#include <QSet>
+#include <stdio.h>
+#include "category.h"
+
+using test::shop::Category;
+
+static int count (QSqlDatabase & db)
+{
+    QSqlQuery query (QLatin1String("SELECT COUNT(*) FROM Category;"), db);
+    return query.next () ? query.value (0).toInt () : -1;
+}
+
+static bool check (const QList<Category> & records)
+{
+    QSet<long> ids;
+    foreach (const Category & record, records) {
+        if (record.isNew ())
+            return false;
+        ids.insert (record.getId ());
+    }
+    return ids.size () == records.size ();
+}
+
+int main (int argc, char *argv[])
+{
+    QCoreApplication app (argc, argv);
+    QSqlDatabase db = QSqlDatabase::addDatabase (QLatin1String("QSQLITE"));
+    db.setDatabaseName (QLatin1String(":memory:"));
+    if (!db.open ())
+        return 2;
+    QSqlQuery query (db);
+    query.exec (QLatin1String(
+        "CREATE TABLE Category (id INTEGER PRIMARY KEY, name VARCHAR(64));"));
+    query.exec (QLatin1String(
+        "INSERT INTO Category (id, name) VALUES (10, 'old');"));
+
+    QList<Category> records;
+    for (int i = 0; i < 3; ++i) {
+        Category record;
+        record.setName (QString::number (i));
+        records.append (record);
+    }
+    if (!Category::saveMany (records, db) || !check (records) ||
+            count (db) != 4)
+        return 3;
+
+    // saved again: updated, not inserted a second time
+    records[0].setName (QLatin1String("changed"));
+    records.append (Category ());
+    if (!Category::saveMany (records, db) || !check (records) ||
+            count (db) != 5)
+        return 4;
+
+    Category loaded;
+    if (!loaded.initFromId (&loaded, db, records.at (0).getId ()) ||
+            loaded.name != QLatin1String("changed"))
+        return 5;
+    printf ("ok\\n");
+    return 0;
+}
+'''
+
+class TestSaveMany(GeneratorTestCase):
+    '''Records saved with saveMany get the ids of their rows'''
+
+    def test_sqlite(self):
+        build_args = self.qt_build_args()
+        xml_file = self.write_input(SHOP_XML)
+        self.generate(xml_file, 'out', [
+            '--namespace', 'test',
+            '--importh', 'dbstruct/dbstruct-config.h'])
+        out_dir = os.path.join(self.tmp_dir, 'out')
+        main_file = os.path.join(self.tmp_dir, 'main.cc')
+        with open(main_file, 'w') as fout:
+            fout.write(SAVE_MANY_CC)
+        program = os.path.join(self.tmp_dir, 'save_many')
+        process = subprocess.Popen(
+            ['c++', '-o', program, main_file, '-I' + out_dir] +
+            glob.glob(os.path.join(HERE, '*.cc')) +
+            glob.glob(os.path.join(out_dir, '*.cc')) + build_args,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+
+        process = subprocess.Popen(
+            [program], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+
+if __name__ == '__main__':
+    unittest.main()